@@ -0,0 +1,63 @@
+"""full-text search on olx_ads: tsvector + GIN (Postgres) / FTS5 (SQLite)
+
+Revision ID: 0b6e9d2f4c17
+Revises: f2c8d4e6a913
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0b6e9d2f4c17"
+down_revision = "f2c8d4e6a913"
+branch_labels = None
+depends_on = None
+
+TSV_EXPR = (
+    "setweight(to_tsvector('simple'::regconfig, coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('russian'::regconfig, coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple'::regconfig, coalesce(category, '')), 'B') || "
+    "setweight(to_tsvector('russian'::regconfig, coalesce(category, '')), 'B')"
+)
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute(
+            "ALTER TABLE olx_ads ADD COLUMN search_tsv tsvector "
+            f"GENERATED ALWAYS AS ({TSV_EXPR}) STORED"
+        )
+        op.execute("CREATE INDEX ix_olx_ads_search_tsv ON olx_ads USING gin (search_tsv)")
+    elif dialect == "sqlite":
+        op.execute(
+            "CREATE VIRTUAL TABLE olx_ads_fts USING fts5("
+            "title, category, content='olx_ads', content_rowid='id')"
+        )
+        op.execute(
+            "CREATE TRIGGER olx_ads_fts_ai AFTER INSERT ON olx_ads BEGIN "
+            "INSERT INTO olx_ads_fts(rowid, title, category) VALUES (new.id, new.title, new.category); END"
+        )
+        op.execute(
+            "CREATE TRIGGER olx_ads_fts_ad AFTER DELETE ON olx_ads BEGIN "
+            "INSERT INTO olx_ads_fts(olx_ads_fts, rowid, title, category) "
+            "VALUES ('delete', old.id, old.title, old.category); END"
+        )
+        op.execute(
+            "CREATE TRIGGER olx_ads_fts_au AFTER UPDATE OF title, category ON olx_ads BEGIN "
+            "INSERT INTO olx_ads_fts(olx_ads_fts, rowid, title, category) "
+            "VALUES ('delete', old.id, old.title, old.category); "
+            "INSERT INTO olx_ads_fts(rowid, title, category) VALUES (new.id, new.title, new.category); END"
+        )
+        op.execute("INSERT INTO olx_ads_fts(olx_ads_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_olx_ads_search_tsv")
+        op.execute("ALTER TABLE olx_ads DROP COLUMN IF EXISTS search_tsv")
+    elif dialect == "sqlite":
+        op.execute("DROP TRIGGER IF EXISTS olx_ads_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS olx_ads_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS olx_ads_fts_ai")
+        op.execute("DROP TABLE IF EXISTS olx_ads_fts")
@@ -0,0 +1,26 @@
+"""add keyset index to olx_report_items
+
+Revision ID: 3f8a1c2d9e71
+Revises: b0219b1b8268
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "3f8a1c2d9e71"
+down_revision = "b0219b1b8268"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_olx_report_items_report_position",
+        "olx_report_items",
+        ["report_id", "position", "id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_olx_report_items_report_position", table_name="olx_report_items")
@@ -0,0 +1,34 @@
+"""brand / brand_score / model on search_queries
+
+c41c5034a759 was meant to add these columns but shipped empty
+(and is already applied everywhere), so they are added here.
+
+Revision ID: 5d1a7e3c9b24
+Revises: 0b6e9d2f4c17
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "5d1a7e3c9b24"
+down_revision = "0b6e9d2f4c17"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("search_queries", sa.Column("brand", sa.String(length=64), nullable=True))
+    op.add_column("search_queries", sa.Column("brand_score", sa.Float(), nullable=True))
+    op.add_column("search_queries", sa.Column("model", sa.String(length=128), nullable=True))
+    op.create_index("ix_search_queries_brand_created", "search_queries", ["brand", "created_at"])
+    op.create_index("ix_search_queries_brand_model", "search_queries", ["brand", "model"])
+    # заполнение существующих строк: python -m scripts.backfill_search_enrichment
+
+
+def downgrade() -> None:
+    op.drop_index("ix_search_queries_brand_model", table_name="search_queries")
+    op.drop_index("ix_search_queries_brand_created", table_name="search_queries")
+    op.drop_column("search_queries", "model")
+    op.drop_column("search_queries", "brand_score")
+    op.drop_column("search_queries", "brand")
@@ -0,0 +1,31 @@
+"""add trigram index on olx_reports.query_url
+
+Revision ID: 7c2e5b4a0d13
+Revises: 3f8a1c2d9e71
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "7c2e5b4a0d13"
+down_revision = "3f8a1c2d9e71"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        # ILIKE '%q%' по query_url -> GIN trigram вместо seq scan
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_olx_reports_query_url_trgm "
+            "ON olx_reports USING gin (query_url gin_trgm_ops)"
+        )
+    # SQLite и прочие: btree не обслуживает ILIKE '%q%', индекс не создаём —
+    # фильтр по query_url идёт сканом по первичному ключу в порядке id DESC
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_olx_reports_query_url_trgm")
@@ -0,0 +1,57 @@
+"""search_daily_agg: daily rollup of searches for trend endpoints
+
+Revision ID: 8e4f2a6c1d57
+Revises: 5d1a7e3c9b24
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "8e4f2a6c1d57"
+down_revision = "5d1a7e3c9b24"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "search_daily_agg",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("normalized_query", sa.String(length=255), nullable=False),
+        sa.Column("category_id", sa.Integer(), sa.ForeignKey("categories.id"), nullable=True),
+        sa.Column("brand", sa.String(length=64), nullable=True),
+        sa.Column("searches", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("popularity", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("results", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.create_index(
+        "uq_search_daily_agg_key",
+        "search_daily_agg",
+        ["day", "normalized_query", sa.text("COALESCE(category_id, 0)")],
+        unique=True,
+    )
+    op.create_index("ix_search_daily_agg_nq_day", "search_daily_agg", ["normalized_query", "day"])
+    op.create_index("ix_search_daily_agg_brand_day", "search_daily_agg", ["brand", "day"])
+
+    # начальное заполнение из search_queries (то же, что scripts/rebuild_search_daily_agg.py)
+    op.execute(
+        """
+        INSERT INTO search_daily_agg
+            (day, normalized_query, category_id, brand, searches, popularity, results)
+        SELECT DATE(created_at), normalized_query, category_id, MAX(brand),
+               COALESCE(SUM(popularity), 0), COALESCE(SUM(popularity), 0),
+               COALESCE(SUM(results_count * popularity), 0)
+        FROM search_queries
+        WHERE created_at IS NOT NULL
+        GROUP BY DATE(created_at), normalized_query, category_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_search_daily_agg_brand_day", table_name="search_daily_agg")
+    op.drop_index("ix_search_daily_agg_nq_day", table_name="search_daily_agg")
+    op.drop_index("uq_search_daily_agg_key", table_name="search_daily_agg")
+    op.drop_table("search_daily_agg")
@@ -0,0 +1,36 @@
+"""search_events: append-only stream of searches folded by the compactor
+
+Revision ID: a3f7c1e9d2b6
+Revises: 8e4f2a6c1d57
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "a3f7c1e9d2b6"
+down_revision = "8e4f2a6c1d57"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # только PK: очередь короткая (компактор удаляет свёрнутые события), вставка дешёвая
+    op.create_table(
+        "search_events",
+        sa.Column("id", sa.BigInteger().with_variant(sa.Integer(), "sqlite"), primary_key=True),
+        sa.Column("ts", sa.DateTime(), nullable=False),
+        sa.Column("query", sa.String(length=255), nullable=False),
+        sa.Column("normalized_query", sa.String(length=255), nullable=False),
+        sa.Column("category_id", sa.Integer(), nullable=True),
+        sa.Column("results_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("source", sa.String(length=32), nullable=True),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("brand", sa.String(length=64), nullable=True),
+        sa.Column("brand_score", sa.Float(), nullable=True),
+        sa.Column("model", sa.String(length=128), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("search_events")
@@ -0,0 +1,26 @@
+"""add (report_id, external_id) index to olx_report_items
+
+Revision ID: a94d6e0f2b58
+Revises: 7c2e5b4a0d13
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "a94d6e0f2b58"
+down_revision = "7c2e5b4a0d13"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_olx_report_items_report_external",
+        "olx_report_items",
+        ["report_id", "external_id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_olx_report_items_report_external", table_name="olx_report_items")
@@ -0,0 +1,35 @@
+"""search_events: keep events after compaction (compacted_at), pending/ts indexes
+
+Revision ID: b7e2c9f4a610
+Revises: d9a4f1b7c305
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "b7e2c9f4a610"
+down_revision = "d9a4f1b7c305"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # события, лежащие в таблице сейчас, ещё не свёрнуты — NULL как раз это и значит
+    op.add_column("search_events", sa.Column("compacted_at", sa.DateTime(), nullable=True))
+    op.create_index(
+        "ix_search_events_pending",
+        "search_events",
+        ["id"],
+        postgresql_where=sa.text("compacted_at IS NULL"),
+        sqlite_where=sa.text("compacted_at IS NULL"),
+    )
+    op.create_index("ix_search_events_ts", "search_events", ["ts"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_search_events_ts", table_name="search_events")
+    op.drop_index("ix_search_events_pending", table_name="search_events")
+    # старая схема — очередь: свёрнутые события ей не нужны
+    op.execute("DELETE FROM search_events WHERE compacted_at IS NOT NULL")
+    op.drop_column("search_events", "compacted_at")
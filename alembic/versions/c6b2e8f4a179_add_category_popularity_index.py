@@ -0,0 +1,26 @@
+"""add (category_id, popularity) index to search_queries for auto-keywords
+
+Revision ID: c6b2e8f4a179
+Revises: a3f7c1e9d2b6
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "c6b2e8f4a179"
+down_revision = "a3f7c1e9d2b6"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_search_queries_category_popularity",
+        "search_queries",
+        ["category_id", "popularity"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_search_queries_category_popularity", table_name="search_queries")
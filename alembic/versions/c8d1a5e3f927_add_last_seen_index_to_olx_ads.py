@@ -0,0 +1,21 @@
+"""olx_ads.last_seen_at index: data version probe for the search result cache
+
+Revision ID: c8d1a5e3f927
+Revises: b7e2c9f4a610
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c8d1a5e3f927"
+down_revision = "b7e2c9f4a610"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_olx_ads_last_seen_at", "olx_ads", ["last_seen_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_olx_ads_last_seen_at", table_name="olx_ads")
@@ -0,0 +1,27 @@
+"""drop ix_search_queries_nq_category: covered by uq_search_queries_key
+
+Revision ID: d4f6b8a2c039
+Revises: c8d1a5e3f927
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d4f6b8a2c039"
+down_revision = "c8d1a5e3f927"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # (normalized_query, category_id) — тот же префикс, что у уникального ключа
+    # (normalized_query, COALESCE(category_id, 0)): чтения он не ускоряет, а пишется на каждый upsert
+    op.drop_index("ix_search_queries_nq_category", table_name="search_queries")
+
+
+def downgrade() -> None:
+    op.create_index(
+        "ix_search_queries_nq_category",
+        "search_queries",
+        ["normalized_query", "category_id"],
+    )
@@ -0,0 +1,30 @@
+"""add canonical_url and max_pages to olx_reports
+
+Revision ID: d5b3f7a81c26
+Revises: a94d6e0f2b58
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "d5b3f7a81c26"
+down_revision = "a94d6e0f2b58"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("olx_reports", sa.Column("canonical_url", sa.Text(), nullable=True))
+    op.add_column("olx_reports", sa.Column("max_pages", sa.Integer(), nullable=True))
+    op.create_index(
+        "ix_olx_reports_canonical_pages_created",
+        "olx_reports",
+        ["canonical_url", "max_pages", "created_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_olx_reports_canonical_pages_created", table_name="olx_reports")
+    op.drop_column("olx_reports", "max_pages")
+    op.drop_column("olx_reports", "canonical_url")
@@ -0,0 +1,48 @@
+"""add decayed popularity_score + query_prefix to search_queries, (query_prefix, score) index
+
+Revision ID: d9a4f1b7c305
+Revises: c6b2e8f4a179
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "d9a4f1b7c305"
+down_revision = "c6b2e8f4a179"
+branch_labels = None
+depends_on = None
+
+# те же значения, что зашиты в app/services/popularity.py
+# (SCORE_HALF_LIFE_DAYS, SCORE_EPOCH, QUERY_PREFIX_LEN)
+HALF_LIFE_DAYS = 7.0
+EPOCH = "2026-01-01 00:00:00"
+QUERY_PREFIX_LEN = 3
+
+
+def upgrade() -> None:
+    op.add_column("search_queries", sa.Column("popularity_score", sa.Float(), nullable=True))
+    op.add_column("search_queries", sa.Column("query_prefix", sa.String(length=8), nullable=True))
+
+    # начальное значение: вся накопленная popularity — поиски в момент created_at
+    if op.get_bind().dialect.name == "postgresql":
+        days = f"EXTRACT(EPOCH FROM (COALESCE(created_at, now()) - TIMESTAMP '{EPOCH}')) / 86400.0"
+    else:
+        days = f"(julianday(COALESCE(created_at, CURRENT_TIMESTAMP)) - julianday('{EPOCH}'))"
+    op.execute(
+        "UPDATE search_queries "
+        f"SET popularity_score = COALESCE(popularity, 1) * EXP({0.6931471805599453 / HALF_LIFE_DAYS!r} * {days}), "
+        f"query_prefix = SUBSTR(normalized_query, 1, {QUERY_PREFIX_LEN})"
+    )
+
+    op.create_index(
+        "ix_search_queries_prefix_score",
+        "search_queries",
+        ["query_prefix", sa.text("popularity_score DESC")],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_search_queries_prefix_score", table_name="search_queries")
+    op.drop_column("search_queries", "query_prefix")
+    op.drop_column("search_queries", "popularity_score")
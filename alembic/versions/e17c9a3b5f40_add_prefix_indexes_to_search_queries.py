@@ -0,0 +1,38 @@
+"""add prefix / composite / created_at indexes to search_queries
+
+Revision ID: e17c9a3b5f40
+Revises: d5b3f7a81c26
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "e17c9a3b5f40"
+down_revision = "d5b3f7a81c26"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        # LIKE 'prefix%' не использует обычный btree при не-C collation
+        op.create_index(
+            "ix_search_queries_nq_pattern",
+            "search_queries",
+            ["normalized_query"],
+            postgresql_ops={"normalized_query": "text_pattern_ops"},
+        )
+    op.create_index(
+        "ix_search_queries_nq_category",
+        "search_queries",
+        ["normalized_query", "category_id"],
+    )
+    op.create_index("ix_search_queries_created_at", "search_queries", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_search_queries_created_at", table_name="search_queries")
+    op.drop_index("ix_search_queries_nq_category", table_name="search_queries")
+    if op.get_bind().dialect.name == "postgresql":
+        op.drop_index("ix_search_queries_nq_pattern", table_name="search_queries")
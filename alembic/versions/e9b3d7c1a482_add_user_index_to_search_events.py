@@ -0,0 +1,28 @@
+"""search_events (user_id, ts) partial index for per-user analytics
+
+Revision ID: e9b3d7c1a482
+Revises: d4f6b8a2c039
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "e9b3d7c1a482"
+down_revision = "d4f6b8a2c039"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_search_events_user_ts",
+        "search_events",
+        ["user_id", "ts"],
+        postgresql_where=sa.text("user_id IS NOT NULL"),
+        sqlite_where=sa.text("user_id IS NOT NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_search_events_user_ts", table_name="search_events")
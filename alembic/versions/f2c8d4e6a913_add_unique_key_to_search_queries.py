@@ -0,0 +1,53 @@
+"""unique (normalized_query, coalesce(category_id, 0)) on search_queries
+
+Revision ID: f2c8d4e6a913
+Revises: e17c9a3b5f40
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "f2c8d4e6a913"
+down_revision = "e17c9a3b5f40"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # дубликаты (гонки SELECT -> INSERT) сливаем в самую старую запись
+    op.execute(
+        """
+        UPDATE search_queries
+        SET popularity = (
+            SELECT SUM(COALESCE(s2.popularity, 0))
+            FROM search_queries s2
+            WHERE s2.normalized_query = search_queries.normalized_query
+              AND COALESCE(s2.category_id, 0) = COALESCE(search_queries.category_id, 0)
+        )
+        WHERE id IN (
+            SELECT MIN(id) FROM search_queries
+            GROUP BY normalized_query, COALESCE(category_id, 0)
+            HAVING COUNT(*) > 1
+        )
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM search_queries
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM search_queries
+            GROUP BY normalized_query, COALESCE(category_id, 0)
+        )
+        """
+    )
+    op.create_index(
+        "uq_search_queries_key",
+        "search_queries",
+        ["normalized_query", sa.text("COALESCE(category_id, 0)")],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("uq_search_queries_key", table_name="search_queries")
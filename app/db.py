@@ -1,7 +1,7 @@
 # app/db.py
 
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sellcase.db")
@@ -18,6 +18,15 @@ engine = create_engine(
     future=True
 )
 
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, _record):
+        # иначе LIKE в SQLite регистронезависимый и не берёт индекс по normalized_query
+        # (ilike не затрагивает: SQLAlchemy компилирует его в lower() LIKE lower())
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA case_sensitive_like = ON")
+        cur.close()
+
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
@@ -5,7 +5,7 @@ import os
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 
 from app.db import Base, engine, SessionLocal
 
@@ -26,6 +26,19 @@ from app.routers.analytics import router as analytics_router
 # ------------------------------
 # 1) Bootstrap: таблицы + легкие миграции + сиды
 # ------------------------------
+def _add_missing_columns(table: str, columns: dict):
+    """
+    ADD COLUMN для колонок, которых ещё нет (работает и на Postgres, и на SQLite,
+    в отличие от ADD COLUMN IF NOT EXISTS). columns: имя -> DDL-тип.
+    """
+    existing = {c["name"] for c in inspect(engine).get_columns(table)}
+    with engine.connect() as conn:
+        for name, ddl in columns.items():
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl};"))
+        conn.commit()
+
+
 def run_bootstrap():
     # ВАЖНО: чтобы SQLAlchemy увидел модели
     importlib.import_module("app.models")
@@ -48,6 +61,249 @@ def run_bootstrap():
     except Exception as e:
         print("Migration warning (categories.name_ru):", e)
 
+    # индексы items отчёта: keyset-пагинация и diff (create_all не трогает старые таблицы)
+    try:
+        with engine.connect() as conn:
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_olx_report_items_report_position "
+                    "ON olx_report_items (report_id, position, id);"
+                )
+            )
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_olx_report_items_report_external "
+                    "ON olx_report_items (report_id, external_id);"
+                )
+            )
+            conn.commit()
+    except Exception as e:
+        print("Migration warning (olx_report_items indexes):", e)
+
+    # поиск отчётов по query_url: trigram GIN на Postgres, обычный индекс на SQLite
+    try:
+        with engine.connect() as conn:
+            if engine.dialect.name == "postgresql":
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm;"))
+                conn.execute(
+                    text(
+                        "CREATE INDEX IF NOT EXISTS ix_olx_reports_query_url_trgm "
+                        "ON olx_reports USING gin (query_url gin_trgm_ops);"
+                    )
+                )
+            else:
+                # btree не обслуживает ILIKE '%q%', только замедлял запись — убираем,
+                # если остался от прежней версии бутстрапа
+                conn.execute(text("DROP INDEX IF EXISTS ix_olx_reports_query_url;"))
+            conn.commit()
+    except Exception as e:
+        print("Migration warning (olx_reports.query_url index):", e)
+
+    # переиспользование свежих отчётов: канонический URL + число страниц
+    try:
+        _add_missing_columns(
+            "olx_reports",
+            {"canonical_url": "TEXT", "max_pages": "INTEGER"},
+        )
+        with engine.connect() as conn:
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_olx_reports_canonical_pages_created "
+                    "ON olx_reports (canonical_url, max_pages, created_at);"
+                )
+            )
+            conn.commit()
+    except Exception as e:
+        print("Migration warning (olx_reports.canonical_url):", e)
+
+    # индексы search_queries: префиксный LIKE, created_at
+    # ((normalized_query, category_id) не нужен: его покрывает uq_search_queries_key)
+    try:
+        with engine.connect() as conn:
+            if engine.dialect.name == "postgresql":
+                conn.execute(
+                    text(
+                        "CREATE INDEX IF NOT EXISTS ix_search_queries_nq_pattern "
+                        "ON search_queries (normalized_query text_pattern_ops);"
+                    )
+                )
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_search_queries_created_at "
+                    "ON search_queries (created_at);"
+                )
+            )
+            # /search/auto-keywords: топ-N по popularity внутри категории
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_search_queries_category_popularity "
+                    "ON search_queries (category_id, popularity);"
+                )
+            )
+            conn.commit()
+    except Exception as e:
+        print("Migration warning (search_queries indexes):", e)
+
+    # уникальный ключ search_queries для upsert-логирования (сначала сливаем дубликаты)
+    try:
+        # inspector не отражает индексы по выражению в SQLite -> смотрим каталог напрямую
+        if engine.dialect.name == "postgresql":
+            exists_sql = "SELECT 1 FROM pg_indexes WHERE indexname = 'uq_search_queries_key'"
+        else:
+            exists_sql = "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'uq_search_queries_key'"
+        with engine.connect() as conn:
+            if conn.execute(text(exists_sql)).first() is None:
+                conn.execute(
+                    text(
+                        "UPDATE search_queries SET popularity = ("
+                        " SELECT SUM(COALESCE(s2.popularity, 0)) FROM search_queries s2"
+                        " WHERE s2.normalized_query = search_queries.normalized_query"
+                        " AND COALESCE(s2.category_id, 0) = COALESCE(search_queries.category_id, 0)"
+                        ") WHERE id IN ("
+                        " SELECT MIN(id) FROM search_queries"
+                        " GROUP BY normalized_query, COALESCE(category_id, 0)"
+                        " HAVING COUNT(*) > 1);"
+                    )
+                )
+                conn.execute(
+                    text(
+                        "DELETE FROM search_queries WHERE id NOT IN ("
+                        " SELECT MIN(id) FROM search_queries"
+                        " GROUP BY normalized_query, COALESCE(category_id, 0));"
+                    )
+                )
+                conn.execute(
+                    text(
+                        "CREATE UNIQUE INDEX IF NOT EXISTS uq_search_queries_key "
+                        "ON search_queries (normalized_query, COALESCE(category_id, 0));"
+                    )
+                )
+                conn.commit()
+            # (normalized_query, category_id) начинается так же, как ключ, — лишняя запись на каждый upsert
+            conn.execute(text("DROP INDEX IF EXISTS ix_search_queries_nq_category;"))
+            conn.commit()
+    except Exception as e:
+        print("Migration warning (search_queries unique key):", e)
+
+    # обогащение search_queries: brand / brand_score / model + индексы
+    try:
+        _add_missing_columns(
+            "search_queries",
+            {"brand": "VARCHAR(64)", "brand_score": "FLOAT", "model": "VARCHAR(128)"},
+        )
+        with engine.connect() as conn:
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_search_queries_brand_created "
+                    "ON search_queries (brand, created_at);"
+                )
+            )
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_search_queries_brand_model "
+                    "ON search_queries (brand, model);"
+                )
+            )
+            conn.commit()
+    except Exception as e:
+        print("Migration warning (search_queries brand/model):", e)
+
+    # затухающая популярность search_queries.popularity_score + индекс для подсказок
+    try:
+        from app.services.popularity import prefix_backfill_sql, score_backfill_sql
+
+        _add_missing_columns("search_queries", {"popularity_score": "FLOAT", "query_prefix": "VARCHAR(8)"})
+        with engine.connect() as conn:
+            conn.execute(text(score_backfill_sql(engine.dialect.name)))
+            conn.execute(text(prefix_backfill_sql()))
+            conn.execute(text("DROP INDEX IF EXISTS ix_search_queries_nq_score;"))
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_search_queries_prefix_score "
+                    "ON search_queries (query_prefix, popularity_score DESC);"
+                )
+            )
+            conn.commit()
+    except Exception as e:
+        print("Migration warning (search_queries popularity_score):", e)
+
+    # search_events хранятся после компакции: отметка compacted_at + индексы очереди и retention
+    try:
+        _add_missing_columns("search_events", {"compacted_at": "TIMESTAMP"})
+        with engine.connect() as conn:
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_search_events_pending "
+                    "ON search_events (id) WHERE compacted_at IS NULL;"
+                )
+            )
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_search_events_ts ON search_events (ts);"))
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_search_events_user_ts "
+                    "ON search_events (user_id, ts) WHERE user_id IS NOT NULL;"
+                )
+            )
+            conn.commit()
+    except Exception as e:
+        print("Migration warning (search_events.compacted_at):", e)
+
+    # дневной rollup поисков: таблицу создал create_all, первый раз заполняем из search_queries
+    try:
+        from app.services.search_rollup import seed_daily_agg_from_queries
+
+        with engine.connect() as conn:
+            empty = conn.execute(text("SELECT 1 FROM search_daily_agg LIMIT 1")).first() is None
+            has_queries = conn.execute(text("SELECT 1 FROM search_queries LIMIT 1")).first() is not None
+        if empty and has_queries:
+            db = SessionLocal()
+            try:
+                seed_daily_agg_from_queries(db)
+            finally:
+                db.close()
+    except Exception as e:
+        print("Migration warning (search_daily_agg):", e)
+
+    # olx_ads.last_seen_at: версия данных для кэша POST /search (max по индексу)
+    try:
+        with engine.connect() as conn:
+            conn.execute(
+                text("CREATE INDEX IF NOT EXISTS ix_olx_ads_last_seen_at ON olx_ads (last_seen_at);")
+            )
+            conn.commit()
+    except Exception as e:
+        print("Migration warning (olx_ads.last_seen_at index):", e)
+
+    # полнотекстовый индекс olx_ads: tsvector + GIN (Postgres) / FTS5 (SQLite)
+    try:
+        from app.services.ad_search import PG_TSV_EXPR, SQLITE_FTS_DDL
+
+        with engine.connect() as conn:
+            if engine.dialect.name == "postgresql":
+                conn.execute(
+                    text(
+                        "ALTER TABLE olx_ads ADD COLUMN IF NOT EXISTS search_tsv tsvector "
+                        f"GENERATED ALWAYS AS ({PG_TSV_EXPR}) STORED;"
+                    )
+                )
+                conn.execute(
+                    text(
+                        "CREATE INDEX IF NOT EXISTS ix_olx_ads_search_tsv "
+                        "ON olx_ads USING gin (search_tsv);"
+                    )
+                )
+            elif engine.dialect.name == "sqlite":
+                created = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'olx_ads_fts'")
+                ).first() is None
+                for ddl in SQLITE_FTS_DDL:
+                    conn.execute(text(ddl))
+                if created:
+                    conn.execute(text("INSERT INTO olx_ads_fts(olx_ads_fts) VALUES ('rebuild');"))
+            conn.commit()
+    except Exception as e:
+        print("Migration warning (olx_ads full-text):", e)
+
     # Сид категорий (если у тебя есть этот модуль)
     try:
         from app.services.category_seed import seed_categories
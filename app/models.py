@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Boolean, func
+from sqlalchemy import BigInteger, Column, Integer, String, Float, Date, DateTime, ForeignKey, Text, Boolean, Index, func
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .db import Base
@@ -104,9 +104,12 @@ class OlxAd(Base):
     seller_name = Column(String(256), nullable=True)
     location = Column(String(256), nullable=True)
     category = Column(String(256), nullable=True)
+    # Полнотекстовый индекс по title/category живёт вне модели (см. app/services/ad_search.py):
+    # Postgres — генерируемая колонка search_tsv + GIN, SQLite — FTS5-таблица olx_ads_fts.
 
     first_seen_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    last_seen_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # индекс — для max(last_seen_at): версия данных для кэша POST /search
+    last_seen_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
 
     snapshots = relationship("OlxAdSnapshot", back_populates="ad")
 
@@ -167,6 +170,10 @@ class OlxReport(Base):
 
     source = Column(String(32), default="olx", index=True)
     query_url = Column(Text, nullable=False)
+    # нормализованный query_url (без utm/трекинга, с отсортированными параметрами; page сохраняется —
+    # с него начинается парсинг) — для переиспользования
+    canonical_url = Column(Text, nullable=True)
+    max_pages = Column(Integer, nullable=True)
 
     status = Column(String(24), default="done", index=True)  # planned | running | done | error
     error = Column(Text, nullable=True)
@@ -180,6 +187,11 @@ class OlxReport(Base):
 
     items = relationship("OlxReportItem", back_populates="report", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # поиск свежего done-отчёта по тому же URL и числу страниц
+        Index("ix_olx_reports_canonical_pages_created", "canonical_url", "max_pages", "created_at"),
+    )
+
 
 class OlxReportItem(Base):
     __tablename__ = "olx_report_items"
@@ -200,6 +212,13 @@ class OlxReportItem(Base):
 
     report = relationship("OlxReport", back_populates="items")
 
+    __table_args__ = (
+        # keyset-пагинация items отчёта: (report_id, position, id)
+        Index("ix_olx_report_items_report_position", "report_id", "position", "id"),
+        # diff двух отчётов: join по external_id внутри report_id
+        Index("ix_olx_report_items_report_external", "report_id", "external_id"),
+    )
+
 class Category(Base):
     __tablename__ = "categories"
 
@@ -249,10 +268,125 @@ class SearchQuery(Base):
     # Для будущего автокомплита (вес запроса)
     popularity = Column(Integer, default=1)
 
+    # Затухающая популярность (forward decay, см. app/services/popularity.py):
+    # сумма 2 ** ((t - SCORE_EPOCH) / half_life) по поискам; сортировка по ней = "популярно сейчас"
+    popularity_score = Column(Float, nullable=True)
+    # первые QUERY_PREFIX_LEN символов normalized_query (app/services/popularity.py):
+    # ключ индекса подсказок (query_prefix, popularity_score DESC)
+    query_prefix = Column(String(8), nullable=True)
+
     # Источник запроса
     source = Column(String(32), default="manual")
 
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    # Обогащение при логировании (extract_brand / extract_model_from_query),
+    # чтобы аналитика по брендам/моделям была GROUP BY, а не проходом в Python.
+    # brand_score IS NULL = запись ещё не обогащена (см. scripts/backfill_search_enrichment.py)
+    brand = Column(String(64), nullable=True)
+    brand_score = Column(Float, nullable=True)
+    model = Column(String(128), nullable=True)
 
     user = relationship("User", backref="search_queries")
     category = relationship("Category", backref="search_queries")
+
+    __table_args__ = (
+        # /analytics/top-brands, /brand-trends: окно по created_at внутри бренда
+        Index("ix_search_queries_brand_created", "brand", "created_at"),
+        # /analytics/top-models
+        Index("ix_search_queries_brand_model", "brand", "model"),
+        # подсказки: WHERE query_prefix = :p ORDER BY popularity_score DESC LIMIT k — упорядоченный range scan
+        Index("ix_search_queries_prefix_score", query_prefix, popularity_score.desc()),
+        # /search/auto-keywords: ROW_NUMBER() OVER (PARTITION BY category_id ORDER BY popularity)
+        Index("ix_search_queries_category_popularity", "category_id", "popularity"),
+        # ключ для INSERT ... ON CONFLICT (search_log): NULL-категория = 0;
+        # он же обслуживает поиск по normalized_query (=, LIKE 'prefix%' в SQLite)
+        Index(
+            "uq_search_queries_key",
+            normalized_query,
+            func.coalesce(category_id, 0),
+            unique=True,
+        ),
+    )
+
+
+class SearchDailyAgg(Base):
+    """
+    Дневной rollup поисков: одна строка на (day, normalized_query, category_id).
+    Пополняется компактором search_events (app/services/search_log.py), пересобирается
+    из search_queries скриптом scripts/rebuild_search_daily_agg.py.
+    Все трендовые эндпоинты читают отсюда, а не сырые search_queries.
+    """
+    __tablename__ = "search_daily_agg"
+
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)
+    normalized_query = Column(String(255), nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
+    brand = Column(String(64), nullable=True)
+
+    searches = Column(Integer, nullable=False, default=0)    # сколько раз искали за день
+    popularity = Column(Integer, nullable=False, default=0)  # прирост popularity за день
+    results = Column(Integer, nullable=False, default=0)     # сумма results_count по поискам
+
+    __table_args__ = (
+        Index(
+            "uq_search_daily_agg_key",
+            day,
+            normalized_query,
+            func.coalesce(category_id, 0),
+            unique=True,
+        ),
+        # /analytics/query-dynamics, /search/trends по конкретным запросам
+        Index("ix_search_daily_agg_nq_day", "normalized_query", "day"),
+        # /search/brand-trends
+        Index("ix_search_daily_agg_brand_day", "brand", "day"),
+    )
+
+
+class SearchEvent(Base):
+    """
+    Поток поисковых событий: одна строка = один поиск, только INSERT пачками
+    (app/services/search_log.py). Компактор сворачивает новые события
+    в search_queries и search_daily_agg и помечает их compacted_at — горячие
+    строки агрегата обновляет один поток, а не каждый запрос.
+    События хранятся SEARCH_EVENTS_RETENTION_DAYS дней: это по-дневная и
+    по-пользовательская история — из неё пересобирается search_daily_agg
+    и считается /analytics с user_id.
+    """
+    __tablename__ = "search_events"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    ts = Column(DateTime, nullable=False, default=datetime.utcnow)
+    query = Column(String(255), nullable=False)
+    normalized_query = Column(String(255), nullable=False)
+    # без FK: проверка ссылки на каждую вставку потоку не нужна, агрегат её сделает
+    category_id = Column(Integer, nullable=True)
+    results_count = Column(Integer, nullable=False, default=0)
+    source = Column(String(32), nullable=True)
+    user_id = Column(Integer, nullable=True)
+    brand = Column(String(64), nullable=True)
+    brand_score = Column(Float, nullable=True)
+    model = Column(String(128), nullable=True)
+    # NULL — ещё не свёрнуто компактором
+    compacted_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # очередь компактора: частичный индекс только по несвёрнутым — маленький
+        Index(
+            "ix_search_events_pending",
+            "id",
+            postgresql_where=compacted_at.is_(None),
+            sqlite_where=compacted_at.is_(None),
+        ),
+        # пересборка rollup по дням и очистка по retention
+        Index("ix_search_events_ts", "ts"),
+        # /analytics/* с user_id; анонимные поиски (большинство) в индекс не попадают
+        Index(
+            "ix_search_events_user_ts",
+            "user_id",
+            "ts",
+            postgresql_where=user_id.is_not(None),
+            sqlite_where=user_id.is_not(None),
+        ),
+    )
@@ -10,19 +10,15 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func, desc
 
 from app.db import get_db
-from app.models import SearchQuery, Category  # у тебя именно так импортируется в search.py
+from app.models import SearchQuery, SearchDailyAgg, SearchEvent, Category  # у тебя именно так импортируется в search.py
+from app.services.normalize import normalize_query, normalize_text
+from app.services.search_rollup import as_date, period_start
 
 
 router = APIRouter(prefix="/analytics", tags=["Analytics"])
 
-def _norm_text(s: str) -> str:
-    s = (s or "").strip().lower()
-    s = re.sub(r"[^0-9a-zа-яёіїє\s]+", " ", s, flags=re.IGNORECASE)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
-
 def _tokens(s: str) -> List[str]:
-    s = _norm_text(s)
+    s = normalize_text(s)
     toks = [t for t in s.split(" ") if t]
     # можно выкинуть супер-частые слова, если захочешь
     return toks
@@ -66,7 +62,7 @@ def _category_terms(cat) -> List[str]:
     # нормализуем, убираем пустые
     out = []
     for t in terms:
-        nt = _norm_text(t)
+        nt = normalize_text(t)
         if nt:
             out.append(nt)
     return list(dict.fromkeys(out))  # unique preserving order
@@ -153,7 +149,7 @@ def _best_plus_guess(db: Session, query: str, days: int, user_id: Optional[int])
     Внутренняя версия /best-plus, чтобы переиспользовать логику в других эндпоинтах.
     Возвращает dict под CategoryGuessOut.
     """
-    q_norm = query.strip().lower()
+    q_norm = normalize_query(query)
     since = datetime.utcnow() - timedelta(days=days)
 
     # 1) logged
@@ -279,20 +275,34 @@ def top_search_queries(
 ):
     since = datetime.utcnow() - timedelta(days=days)
 
-    q = (
-        db.query(
-            SearchQuery.normalized_query.label("query"),
-            func.count(SearchQuery.id).label("count"),
+    if user_id is None:
+        # дневной rollup: строк = запросы * дни, сколько бы ни было сырой истории
+        count_expr = func.sum(SearchDailyAgg.searches)
+        rows = (
+            db.query(
+                SearchDailyAgg.normalized_query.label("query"),
+                count_expr.label("count"),
+            )
+            .filter(SearchDailyAgg.day >= since.date())
+            .group_by(SearchDailyAgg.normalized_query)
+            .order_by(desc(count_expr))
+            .limit(limit)
+            .all()
         )
-        .filter(SearchQuery.created_at >= since)
-    )
-
-    if user_id is not None:
-        q = q.filter(SearchQuery.user_id == user_id)
+        return [{"query": r.query, "count": int(r.count)} for r in rows]
 
+    # в rollup нет user_id, а search_queries хранит одну строку на запрос (user_id —
+    # последнего искавшего) — по конкретному пользователю считаем по событиям
+    count_expr = func.count(SearchEvent.id)
     rows = (
-        q.group_by(SearchQuery.normalized_query)
-        .order_by(desc(func.count(SearchQuery.id)))
+        db.query(
+            SearchEvent.normalized_query.label("query"),
+            count_expr.label("count"),
+        )
+        .filter(SearchEvent.user_id == user_id)
+        .filter(SearchEvent.ts >= since)
+        .group_by(SearchEvent.normalized_query)
+        .order_by(desc(count_expr))
         .limit(limit)
         .all()
     )
@@ -308,33 +318,44 @@ def query_dynamics(
     user_id: Optional[int] = Query(None, ge=1),
     db: Session = Depends(get_db),
 ):
-    q_norm = query.strip().lower()
+    q_norm = normalize_query(query)
 
     now = datetime.utcnow()
     since = now - timedelta(days=days)
 
-    bucket_expr = func.date_trunc(interval, SearchQuery.created_at).label("bucket")
-
-    base = (
-        db.query(bucket_expr, func.count(SearchQuery.id).label("count"))
-        .filter(SearchQuery.created_at >= since)
-        .filter(SearchQuery.normalized_query == q_norm)
-    )
-    if user_id is not None:
-        base = base.filter(SearchQuery.user_id == user_id)
-
-    rows = base.group_by(bucket_expr).order_by(bucket_expr.asc()).all()
+    # Дневные счётчики: из rollup, а для конкретного user_id — из search_events.
+    # date_trunc не используем: его нет в SQLite, недели сворачиваем в Python.
+    if user_id is None:
+        rows = (
+            db.query(
+                SearchDailyAgg.day.label("day"),
+                func.sum(SearchDailyAgg.searches).label("count"),
+            )
+            .filter(SearchDailyAgg.day >= since.date())
+            .filter(SearchDailyAgg.normalized_query == q_norm)
+            .group_by(SearchDailyAgg.day)
+            .all()
+        )
+    else:
+        day_expr = func.date(SearchEvent.ts)
+        rows = (
+            db.query(day_expr.label("day"), func.count(SearchEvent.id).label("count"))
+            .filter(SearchEvent.user_id == user_id)
+            .filter(SearchEvent.ts >= since)
+            .filter(SearchEvent.normalized_query == q_norm)
+            .group_by(day_expr)
+            .all()
+        )
 
-    # Сводим в dict: дата -> count
-    counts = {}
+    # Сводим в dict: начало интервала -> count
+    counts: Dict[date, int] = {}
     for r in rows:
-        # date_trunc возвращает datetime
-        d = r.bucket.date()
-        counts[d] = int(r.count)
+        b = period_start(as_date(r.day), interval)
+        counts[b] = counts.get(b, 0) + int(r.count)
 
-    # Генерим сетку дат и заполняем нулями
+    # Генерим сетку дат (для week — по понедельникам) и заполняем нулями
     points: List[dict] = []
-    cur = since.date()
+    cur = period_start(since.date(), interval)
     end = now.date()
 
     step_days = 1 if interval == "day" else 7
@@ -359,7 +380,7 @@ def query_to_category(
             func.count(SearchQuery.id).label("count"),
         )
         .filter(SearchQuery.created_at >= since)
-        .filter(SearchQuery.normalized_query == query.strip().lower())
+        .filter(SearchQuery.normalized_query == normalize_query(query))
     )
 
     if user_id is not None:
@@ -380,7 +401,7 @@ def query_to_category_best_plus(
     user_id: Optional[int] = Query(None, ge=1),
     db: Session = Depends(get_db),
 ):
-    q_norm = query.strip().lower()
+    q_norm = normalize_query(query)
     since = datetime.utcnow() - timedelta(days=days)
 
     # --- 1) logged: если category_id уже есть в логах ---
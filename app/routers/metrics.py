@@ -2,6 +2,8 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from app.db import get_db
+from app.services.search_cache import search_cache
+from app.services.stage_timing import stage_histograms
 
 router = APIRouter(prefix="/metrics", tags=["metrics"])
 
@@ -26,3 +28,22 @@ def daily(db: Session = Depends(get_db), days: int = 30):
         group by 1 order by 1
     """)
     return list(db.execute(q).mappings().all())
+
+@router.get("/search-cache")
+def search_cache_stats():
+    """
+    Кэш результатов POST /search: hits / misses / hit_rate, размер, поколение.
+    """
+    return search_cache.stats()
+
+@router.get("/search-timing")
+def search_timing_stats(reset: bool = False):
+    """
+    Гистограммы длительности этапов /search и /search/autocomplete (мс):
+    count / avg / max, p50/p95/p99 (верхняя граница корзины) и сами корзины.
+    Пусто, пока не включен SEARCH_TIMING=1. reset=true — обнулить после чтения.
+    """
+    data = stage_histograms.snapshot()
+    if reset:
+        stage_histograms.reset()
+    return data
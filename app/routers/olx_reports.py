@@ -1,22 +1,89 @@
-from fastapi import APIRouter, Depends, HTTPException, Response, Query
-from sqlalchemy.orm import Session
-from typing import List
-from app.db import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, exists
+from sqlalchemy.orm import Session, aliased
+import json
+from typing import List, Literal, Optional
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from app.db import get_db, SessionLocal
 from app import models
 from app.schemas import (
-    OlxReportCreate, OlxReportOut, OlxReportWithItemsOut, OlxReportListOut
+    OlxReportCreate, OlxReportOut, OlxReportListOut, OlxReportItemsPageOut
 )
 from app.services.olx_parser import fetch_olx_ads
-from app.services.csv_utils import rows_to_csv
+from app.services.csv_utils import iter_csv, CSV_FIELDS
+from app.services.keyset import encode_cursor, decode_cursor, keyset_order, keyset_after
+from app.services.counts import capped_count
 
 router = APIRouter(prefix="/olx/reports", tags=["OLX reports"])
 
+# параметры, которые не влияют на выдачу OLX
+TRACKING_PARAMS = {"fbclid", "gclid", "yclid"}
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Приводим URL к каноническому виду, чтобы одинаковые запросы совпадали:
+    схема/хост в нижнем регистре, без www., без хвостового /, без фрагмента,
+    без utm_* и трекинговых параметров, остальные параметры отсортированы.
+    page остаётся: отчёт парсит max_pages страниц начиная с неё, это другая выдача.
+    """
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = parts.path.rstrip("/") or "/"
+    params = [
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    ]
+    params.sort()
+    return urlunsplit((parts.scheme.lower(), host, path, urlencode(params), ""))
+
+
+def find_fresh_report(
+    db: Session, canonical_url: str, max_pages: int, max_age: int, note: Optional[str] = None
+):
+    """
+    Последний done-отчёт по тому же URL, числу страниц и note не старше max_age секунд.
+    note — часть ключа: отчёт с другой пометкой не переиспользуем и чужую не перезаписываем.
+    """
+    since = datetime.utcnow() - timedelta(seconds=max_age)
+    note_filter = models.OlxReport.note.is_(None) if note is None else models.OlxReport.note == note
+    return (
+        db.query(models.OlxReport)
+        .filter(
+            models.OlxReport.canonical_url == canonical_url,
+            models.OlxReport.max_pages == max_pages,
+            models.OlxReport.created_at >= since,
+            models.OlxReport.status == "done",
+            note_filter,
+        )
+        .order_by(models.OlxReport.created_at.desc())
+        .first()
+    )
+
+
 @router.post("", response_model=OlxReportOut)
 async def create_report(payload: OlxReportCreate, db: Session = Depends(get_db)):
+    canonical_url = canonicalize_url(str(payload.url))
+
+    # свежий отчёт по тому же запросу (и с той же note) — отдаём его, без парсинга и без копии items
+    if payload.max_age is not None:
+        fresh = find_fresh_report(
+            db, canonical_url, payload.max_pages, payload.max_age, payload.note or None
+        )
+        if fresh:
+            return fresh
+
     # создаём запись-черновик (можно сразу planned/running, но делаем просто)
     rpt = models.OlxReport(
         source="olx",
         query_url=str(payload.url),
+        canonical_url=canonical_url,
+        max_pages=payload.max_pages,
         status="running",
         note=payload.note or None,
     )
@@ -78,56 +145,296 @@ def list_reports(
     db: Session = Depends(get_db),
     limit: int = Query(20, ge=1, le=200),
     offset: int = Query(0, ge=0),
+    after_id: Optional[int] = Query(
+        None,
+        ge=1,
+        description="Keyset-пагинация: next_after_id из предыдущей страницы (вместо offset).",
+    ),
     status: str | None = Query(None),
     q: str | None = Query(None),
+    count: Literal["exact", "capped", "none"] = Query(
+        "capped",
+        description="exact — полный count(); capped — не больше count_cap; none — без total.",
+    ),
+    count_cap: int = Query(1000, ge=1, le=100000),
 ):
-    qset = db.query(models.OlxReport).order_by(models.OlxReport.id.desc())
+    qset = db.query(models.OlxReport)
     if status:
         qset = qset.filter(models.OlxReport.status == status)
     if q:
+        # ILIKE '%q%' обслуживается trigram GIN индексом (Postgres)
         like = f"%{q}%"
         qset = qset.filter(models.OlxReport.query_url.ilike(like))
-    total = qset.count()
-    rows = qset.limit(limit).offset(offset).all()
-    return OlxReportListOut(total=total, items=rows)
 
+    total = None
+    total_capped = False
+    if count == "exact":
+        total = qset.count()
+    elif count == "capped":
+        total, total_capped = capped_count(qset, count_cap)
+
+    page = qset.order_by(models.OlxReport.id.desc())
+    if after_id is not None:
+        page = page.filter(models.OlxReport.id < after_id)
+    else:
+        page = page.offset(offset)
+    rows = page.limit(limit).all()
 
-@router.get("/{report_id}", response_model=OlxReportWithItemsOut)
+    next_after_id = rows[-1].id if len(rows) == limit else None
+    return {
+        "total": total,
+        "total_capped": total_capped,
+        "next_after_id": next_after_id,
+        "items": rows,
+    }
+
+
+@router.get("/{report_id}", response_model=OlxReportOut)
 def get_report(report_id: int, db: Session = Depends(get_db)):
     rpt = db.query(models.OlxReport).filter(models.OlxReport.id == report_id).first()
     if not rpt:
         raise HTTPException(status_code=404, detail="Report not found")
-    # при необходимости можно добавить пагинацию по items
+    # только шапка отчёта; строки — через /{report_id}/items
     return rpt
 
 
+# колонки, которые можно запросить через ?fields=
+ITEM_FIELDS = CSV_FIELDS
+
+# sort -> (колонка, desc)
+ITEM_SORTS = {
+    "position": (models.OlxReportItem.position, False),
+    "price_asc": (models.OlxReportItem.price, False),
+    "price_desc": (models.OlxReportItem.price, True),
+}
+
+
+@router.get("/{report_id}/items", response_model=OlxReportItemsPageOut)
+def list_report_items(
+    report_id: int,
+    db: Session = Depends(get_db),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="next_cursor из предыдущей страницы"),
+    sort: Literal["position", "price_asc", "price_desc"] = Query("position"),
+    fields: Optional[str] = Query(
+        None,
+        description="Колонки через запятую, например: external_id,title,price. По умолчанию — все.",
+    ),
+):
+    """
+    Строки отчёта с keyset-пагинацией по (position, id) или (price, id).
+    Без OFFSET: каждая страница — range scan по индексу, независимо от глубины.
+    """
+    report_exists = (
+        db.query(models.OlxReport.id)
+        .filter(models.OlxReport.id == report_id)
+        .first()
+    )
+    if not report_exists:
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    if fields:
+        selected = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in selected if f not in ITEM_FIELDS]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(unknown)}",
+            )
+        selected = list(dict.fromkeys(selected))
+    else:
+        selected = list(ITEM_FIELDS)
+
+    Item = models.OlxReportItem
+    sort_col, desc = ITEM_SORTS[sort]
+
+    # ключ сортировки и id тянем всегда (нужны для курсора), в ответ — только selected
+    columns = [getattr(Item, f) for f in selected]
+    columns += [sort_col.label("_sort_key"), Item.id.label("_id")]
+
+    q = db.query(*columns).filter(Item.report_id == report_id)
+
+    after = decode_cursor(cursor, 2)
+    if after is not None:
+        q = q.filter(keyset_after(sort_col, Item.id, after[0], after[1], desc=desc))
+
+    # берём на одну строку больше, чтобы понять, есть ли следующая страница
+    rows = q.order_by(*keyset_order(sort_col, Item.id, desc=desc)).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last._sort_key, last._id)
+
+    return OlxReportItemsPageOut(
+        report_id=report_id,
+        sort=sort,
+        limit=limit,
+        fields=selected,
+        items=[{f: getattr(r, f) for f in selected} for r in rows],
+        next_cursor=next_cursor,
+    )
+
+
+# сколько строк тянем из серверного курсора за раз
+CSV_YIELD_PER = 1000
+
+
+def _iter_report_csv(report_id: int):
+    """
+    Генератор CSV по отчёту поверх серверного курсора (yield_per).
+    Сессия своя: зависимость get_db закрывается до того, как
+    StreamingResponse начнёт читать генератор.
+    """
+    db = SessionLocal()
+    try:
+        Item = models.OlxReportItem
+        rows = (
+            db.query(*[getattr(Item, f) for f in CSV_FIELDS])
+            .filter(Item.report_id == report_id)
+            .order_by(*keyset_order(Item.position, Item.id))
+            .yield_per(CSV_YIELD_PER)
+        )
+        yield from iter_csv(rows, chunk_rows=CSV_YIELD_PER)
+    finally:
+        db.close()
+
+
 @router.get("/{report_id}/download")
 def download_report_csv(report_id: int, db: Session = Depends(get_db)):
-    rpt = db.query(models.OlxReport).filter(models.OlxReport.id == report_id).first()
-    if not rpt:
+    report_exists = (
+        db.query(models.OlxReport.id)
+        .filter(models.OlxReport.id == report_id)
+        .first()
+    )
+    if not report_exists:
         raise HTTPException(status_code=404, detail="Report not found")
 
-    items = db.query(models.OlxReportItem).filter(models.OlxReportItem.report_id == report_id).all()
-
-    rows = []
-    for it in items:
-        rows.append({
-            "external_id": it.external_id,
-            "title": it.title,
-            "url": it.url,
-            "price": it.price,
-            "currency": it.currency,
-            "seller_id": it.seller_id,
-            "seller_name": it.seller_name,
-            "location": it.location,
-            "position": it.position,
-            "page": it.page,
-        })
-
-    csv_bytes = rows_to_csv(rows)
     filename = f"sellcase_report_{report_id}.csv"
-    return Response(
-        content=csv_bytes,
+    return StreamingResponse(
+        _iter_report_csv(report_id),
         media_type="text/csv; charset=utf-8",
         headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
+
+
+# сколько строк diff тянем из курсора за раз
+DIFF_YIELD_PER = 2000
+
+
+def _is_latest(item):
+    """
+    Условие "нет более поздней строки с тем же external_id в этом отчёте":
+    OLX иногда отдаёт одно объявление дважды (промо + обычная выдача),
+    в диффе берём последнее распарсенное. Проверка — index probe по
+    (report_id, external_id), без оконных функций и сортировок.
+    """
+    later = aliased(models.OlxReportItem)
+    return ~exists().where(
+        and_(
+            later.report_id == item.report_id,
+            later.external_id == item.external_id,
+            later.id > item.id,
+        )
+    )
+
+
+def _iter_report_diff(report_a: int, report_b: int):
+    """
+    NDJSON-поток изменений между отчётами A и B (join по external_id в SQL):
+    added — есть только в B, removed — только в A, price_changed — цена отличается.
+    Каждая сторона берётся по одной строке на external_id (_is_latest),
+    иначе дубль в отчёте дал бы повторные строки диффа.
+    Все три запроса — range scan по (report_id, external_id).
+    """
+    db = SessionLocal()
+    try:
+        A = aliased(models.OlxReportItem)
+        B = aliased(models.OlxReportItem)
+
+        def dump(row: dict) -> bytes:
+            return (json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8")
+
+        # --- added: в B есть, в A нет ---
+        added = (
+            db.query(B.external_id, B.title, B.url, B.price)
+            .filter(B.report_id == report_b, B.external_id.isnot(None), _is_latest(B))
+            .filter(
+                ~exists().where(
+                    and_(A.report_id == report_a, A.external_id == B.external_id)
+                )
+            )
+            .yield_per(DIFF_YIELD_PER)
+        )
+        for ext_id, title, url, price in added:
+            yield dump({
+                "change": "added",
+                "external_id": ext_id,
+                "title": title,
+                "url": url,
+                "price_a": None,
+                "price_b": price,
+            })
+
+        # --- removed: в A есть, в B нет ---
+        removed = (
+            db.query(A.external_id, A.title, A.url, A.price)
+            .filter(A.report_id == report_a, A.external_id.isnot(None), _is_latest(A))
+            .filter(
+                ~exists().where(
+                    and_(B.report_id == report_b, B.external_id == A.external_id)
+                )
+            )
+            .yield_per(DIFF_YIELD_PER)
+        )
+        for ext_id, title, url, price in removed:
+            yield dump({
+                "change": "removed",
+                "external_id": ext_id,
+                "title": title,
+                "url": url,
+                "price_a": price,
+                "price_b": None,
+            })
+
+        # --- price_changed: есть в обоих, цена другая ---
+        changed = (
+            db.query(B.external_id, B.title, B.url, A.price, B.price)
+            .join(A, and_(A.external_id == B.external_id, A.report_id == report_a))
+            .filter(B.report_id == report_b, _is_latest(B), _is_latest(A))
+            .filter(A.price.is_distinct_from(B.price))
+            .yield_per(DIFF_YIELD_PER)
+        )
+        for ext_id, title, url, price_a, price_b in changed:
+            yield dump({
+                "change": "price_changed",
+                "external_id": ext_id,
+                "title": title,
+                "url": url,
+                "price_a": price_a,
+                "price_b": price_b,
+            })
+    finally:
+        db.close()
+
+
+@router.get("/{report_id}/diff/{other_id}")
+def diff_reports(report_id: int, other_id: int, db: Session = Depends(get_db)):
+    """
+    Сравнение двух отчётов (обычно по одному и тому же URL).
+    Ответ — NDJSON: по строке на каждое added / removed / price_changed объявление.
+    """
+    found = {
+        r.id
+        for r in db.query(models.OlxReport.id)
+        .filter(models.OlxReport.id.in_([report_id, other_id]))
+        .all()
+    }
+    if report_id not in found or other_id not in found:
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    return StreamingResponse(
+        _iter_report_diff(report_id, other_id),
+        media_type="application/x-ndjson",
+    )
@@ -3,17 +3,40 @@
 from datetime import datetime, timedelta, date
 from typing import List, Optional, Dict, Tuple, Any
 from typing_extensions import Literal
-from collections import Counter
+from concurrent.futures import Executor
 
+import json
 import re
 
-from fastapi import APIRouter, Depends, Query
-from pydantic import BaseModel
-from sqlalchemy import func, or_, and_
-from sqlalchemy.orm import Session
-
-from app.db import get_db
-from app.models import Category, SearchQuery, OlxAd
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session, aliased
+
+from app.db import SessionLocal, get_db
+from app.models import Category, SearchDailyAgg, SearchQuery
+from app.services.category_index import CachedCategory, get_category_index, invalidate_category_index
+from app.services.counts import capped_count, estimated_count
+from app.services.csv_utils import iter_csv, iter_gzip
+from app.services.ad_search import search_ads, search_item_columns
+from app.services.brand_matcher import BrandMatcher
+from app.services.keyset import decode_cursor, encode_cursor, keyset_after, keyset_order
+from app.services.normalize import normalize_query, normalize_query_advanced, normalize_text
+from app.services.popularity import current_score
+from app.services.search_cache import search_cache
+from app.services.search_log import log_search_event_now, search_log_buffer
+from app.services.search_rollup import as_date, period_start
+from app.services.spell_index import get_spell_index, start_spell_refresh
+from app.services.stage_timing import start_timer
+from app.services.suggest_index import (
+    KIND_CATEGORY,
+    KIND_HINT,
+    TOP_K,
+    get_suggest_index,
+    start_suggest_refresh,
+    top_queries,
+)
 
 # --- helpers: category + brand extraction ---
 
@@ -22,26 +45,14 @@ COMMON_BRANDS = {
     "hp", "msi", "sony", "lg", "nokia", "oneplus", "google", "motorola",
 }
 
-def detect_category_from_query(db: Session, normalized: str) -> Optional[Category]:
+def detect_category_from_query(db: Session, normalized: str) -> Optional[CachedCategory]:
     q = (normalized or "").strip().lower()
     if not q:
         return None
 
-    # Пытаемся найти категорию по name/slug/keywords (keywords предполагается строкой с ключевиками)
-    # Работает даже если keywords=None
-    return (
-        db.query(Category)
-        .filter(
-            or_(
-                func.lower(Category.slug) == q,
-                func.lower(Category.name) == q,
-                func.lower(Category.name).ilike(f"%{q}%"),
-                func.coalesce(func.lower(Category.keywords), "").ilike(f"%{q}%"),
-            )
-        )
-        .order_by(Category.id.asc())
-        .first()
-    )
+    # Ищем по slug/name (точно) и вхождению в name/name_ru/keywords —
+    # через in-memory индекс, без запроса в БД (см. app/services/category_index.py)
+    return get_category_index(db).match(q)
 
 def extract_brand(normalized: str) -> Tuple[Optional[str], int]:
     q = (normalized or "").strip().lower()
@@ -56,34 +67,6 @@ def extract_brand(normalized: str) -> Tuple[Optional[str], int]:
 
     return None, 0
 
-def normalize_query_advanced(q: str) -> str:
-    q = q.strip().lower()
-
-    repl = {
-        "айф": "айфон",
-        "iphone": "айфон",
-        "ifon": "айфон",
-
-        "смартф": "смартфон",
-        "тел": "телефон",
-
-        "ноут": "ноутбук",
-        "mac": "макбук",
-        "macbook": "макбук",
-
-        "квар": "квартира",
-        "оренда": "аренда",
-        "аренда": "аренда",
-
-        "авто": "авто",
-    }
-
-    for key, val in repl.items():
-        if q.startswith(key):
-            return val
-
-    return q
-
 # Каноническое имя -> список синонимов/вариантов написания
 BRAND_SYNONYMS = {
     "Apple": ["apple", "iphone", "айфон", "айф", "айфо", "айфончик", "ipad", "айпад", "macbook", "макбук", "mac", "мака"],
@@ -110,12 +93,8 @@ STOP_TOKENS = {
 }
 
 def _tokens(s: str) -> list[str]:
-    # normalize_query у тебя уже приводит к нижнему регистру и чистит пробелы — используем его
-    s = normalize_query(s)
-    # оставим буквы/цифры/пробел
-    s = re.sub(r"[^0-9a-zа-яёіїєґ\s]+", " ", s, flags=re.IGNORECASE)
-    parts = [p for p in s.split() if p and p not in STOP_TOKENS]
-    return parts
+    # normalize_text: нижний регистр, только буквы/цифры/пробел (app/services/normalize.py)
+    return [p for p in normalize_text(s).split() if p not in STOP_TOKENS]
 
 def extract_model_from_query(normalized_query: str, brand: str) -> Optional[str]:
     if not normalized_query:
@@ -146,43 +125,72 @@ def extract_brand(query: str) -> Tuple[Optional[str], float]:
     """
     Возвращает (brand, score). score 0..1.
     brand — каноническое имя из BRAND_SYNONYMS.
+    Матчинг — скомпилированный автомат _BRAND_MATCHER (собирается один раз ниже).
     """
-    qn = normalize_query(query)
-    toks = _tokens(qn)
-    if not toks:
-        return None, 0.0
-
-    # Для поиска фраз типа "new balance"
-    qn_spaced = f" {qn} "
-
-    best_brand = None
-    best_score = 0.0
-
-    for brand, variants in BRAND_SYNONYMS.items():
-        local_best = 0.0
-        for v in variants:
-            v_norm = normalize_query(v)
-
-            # Фразовый матч (для "new balance" / "нью баланс" и т.п.)
-            if " " in v_norm:
-                if f" {v_norm} " in qn_spaced:
-                    local_best = max(local_best, 1.0)
-                continue
+    return _BRAND_MATCHER.match(query)
 
-            # Токенный матч
-            if v_norm in toks:
-                local_best = max(local_best, 0.95)
-                continue
 
-            # Подстрочный матч для случаев "iphone11", "ps5" и т.п.
-            if v_norm and v_norm in qn:
-                local_best = max(local_best, 0.75)
+def enrich_search_query(normalized_query: str) -> Dict[str, Any]:
+    """
+    brand / brand_score / model для колонок search_queries — считаются один раз при логировании.
+    """
+    brand, score = extract_brand(normalized_query)
+    model = extract_model_from_query(normalized_query, brand) if brand else None
+    return {"brand": brand, "brand_score": float(score), "model": model}
+
+# от стольких строк на весь прогон бэкфилл поднимает пул процессов (один на прогон)
+BRAND_POOL_MIN = 50_000
+# кусок на одну задачу пула: пачка бэкфилла (5000) делится между всеми процессами
+BRAND_POOL_CHUNK = 500
+
 
-        if local_best > best_score:
-            best_score = local_best
-            best_brand = brand
+def _extract_brands_chunk(chunk: List[str]) -> List[Tuple[Optional[str], float]]:
+    # выполняется и в дочерних процессах: автомат там уже есть (fork) или соберётся при импорте
+    return _BRAND_MATCHER.match_many(chunk)
 
-    return best_brand, best_score
+
+def extract_brands_many(
+    queries: List[str],
+    pool: Optional[Executor] = None,
+) -> List[Tuple[Optional[str], float]]:
+    """
+    Батч-версия extract_brand для перетегирования истории: входы дедуплицируются,
+    каждая уникальная строка проходит автомат один раз; порядок и длина сохраняются.
+    pool — ProcessPoolExecutor, который вызывающий держит на весь прогон
+    (см. scripts/backfill_search_enrichment.py); без него — в текущем процессе.
+    """
+    uniq = list(dict.fromkeys(queries))
+
+    if pool is not None and len(uniq) > BRAND_POOL_CHUNK:
+        chunks = [uniq[i:i + BRAND_POOL_CHUNK] for i in range(0, len(uniq), BRAND_POOL_CHUNK)]
+        results = [r for part in pool.map(_extract_brands_chunk, chunks) for r in part]
+    else:
+        results = _extract_brands_chunk(uniq)
+
+    found = dict(zip(uniq, results))
+    return [found[q] for q in queries]
+
+
+def enrich_search_queries_many(
+    normalized_queries: List[str],
+    pool: Optional[Executor] = None,
+) -> List[Dict[str, Any]]:
+    """
+    enrich_search_query для пачки (бэкфилл): бренды — extract_brands_many,
+    модель считается один раз на уникальную пару (запрос, бренд).
+    """
+    brands = extract_brands_many(normalized_queries, pool)
+    models: Dict[Tuple[str, str], Optional[str]] = {}
+    out = []
+    for nq, (brand, score) in zip(normalized_queries, brands):
+        model = None
+        if brand:
+            key = (nq, brand)
+            if key not in models:
+                models[key] = extract_model_from_query(nq, brand)
+            model = models[key]
+        out.append({"brand": brand, "brand_score": float(score), "model": model})
+    return out
 
 # ==== СЮДА ВСТАВЬ ЭТО ====
 
@@ -274,117 +282,15 @@ router = APIRouter(
 )
 
 
-# ===== Вспомогательная функция нормализации запроса =====
-
-def normalize_query(q: str) -> str:
-    """
-    Приводим запрос к нижнему регистру, убираем лишние пробелы.
-    """
-    q = q.strip().lower()
-    q = re.sub(r"\s+", " ", q)
-    return q
-
-# ===== Словари брендов и вспомогательные функции =====
-
-# Известные бренды по категориям (можем расширять по ходу)
-KNOWN_BRANDS: Dict[str, Dict[str, str]] = {
-    # Телефоны и смартфоны
-    "electronics_phones": {
-        "iphone": "Apple",
-        "айфон": "Apple",
-        "apple": "Apple",
-        "samsung": "Samsung",
-        "самсунг": "Samsung",
-        "xiaomi": "Xiaomi",
-        "redmi": "Xiaomi",
-        "mi ": "Xiaomi",       # пробел специально, чтобы не ловить случайные совпадения
-        "oneplus": "OnePlus",
-        "huawei": "Huawei",
-        "honor": "Honor",
-        "realme": "Realme",
-        "oppo": "Oppo",
-        "nokia": "Nokia",
-    },
-    # Ноутбуки (пока для будущего)
-    "electronics_laptops": {
-        "macbook": "Apple",
-        "lenovo": "Lenovo",
-        "dell": "Dell",
-        "asus": "Asus",
-        "acer": "Acer",
-        "hp": "HP",
-        "msi": "MSI",
-    },
-}
-
-# Стоп-слова, которые не считаем брендами при эвристике
-BRAND_STOP_WORDS = {
-    "купить",
-    "цена",
-    "кредит",
-    "б/у",
-    "бу",
-    "used",
-    "olx",
-    "дешево",
-    "недорого",
-}
-
-
-def detect_brand_from_query(
-    normalized_query: str,
-    category_slug: Optional[str] = None,
-) -> Optional[str]:
-    """
-    Пытаемся вытащить бренд из normalized_query.
-
-    Стратегия (вариант C):
-    1) Сначала ищем в словаре брендов по категории.
-    2) Потом ищем по всем категориям (на случай, если category_slug не указан).
-    3) Если не нашли — эвристика: берём первое слово из запроса как бренд,
-       если это не стоп-слово, не чистое число и не слишком короткое.
-    """
-    q = normalized_query or ""
-    q = q.strip()
-
-    if not q:
-        return None
-
-    # 1) Сначала проверяем словарь для конкретной категории
-    if category_slug and category_slug in KNOWN_BRANDS:
-        for pattern, brand_name in KNOWN_BRANDS[category_slug].items():
-            if pattern in q:
-                return brand_name
-
-    # 2) Если не нашли — пробегаемся по всем категориям/паттернам
-    for cat_slug, patterns in KNOWN_BRANDS.items():
-        # если категория передана, можем ограничиться ею
-        if category_slug and cat_slug != category_slug:
-            continue
-        for pattern, brand_name in patterns.items():
-            if pattern in q:
-                return brand_name
-
-    # 3) Эвристика: берём первое слово как «кандидата в бренд»
-    tokens = q.split()
-    if not tokens:
-        return None
-
-    first = tokens[0]
-
-    # отсеиваем стоп-слова
-    if first in BRAND_STOP_WORDS:
-        return None
-
-    # отсеиваем чистые числа
-    if first.isdigit():
-        return None
+# BRAND_SYNONYMS -> Aho-Corasick, варианты нормализуются один раз при импорте
+_BRAND_MATCHER = BrandMatcher(BRAND_SYNONYMS, normalize=normalize_query, tokenize=_tokens)
 
-    # очень короткие куски тоже отбрасываем
-    if len(first) < 3:
-        return None
 
-    return first
+@router.on_event("startup")
+def _start_index_refresh():
+    # trie подсказок и словарь опечаток собираются при старте и дальше обновляются в фоне — не в запросе
+    start_suggest_refresh(AI_HINTS)
+    start_spell_refresh(BRAND_SYNONYMS)
 
 
 # ===== Pydantic-схемы ответов =====
@@ -401,7 +307,8 @@ class CategoryOut(BaseModel):
 
 
 class AutocompleteItem(BaseModel):
-    type: Literal["query", "category"]
+    # correction — исправленный запрос ("самсунк" -> "самсунг"), идёт первым
+    type: Literal["query", "category", "correction"]
     value: str
     category_id: Optional[int] = None
     slug: Optional[str] = None
@@ -555,54 +462,31 @@ def log_search_query(
     source: str = "frontend",
     category: Optional[Category] = None,
     user_id: Optional[int] = None,
-) -> SearchQuery:
+):
     """
-    Пишем запрос в таблицу search_queries.
-
-    Логика:
-    - нормализуем запрос;
-    - ищем запись с таким же normalized_query + category_id;
-    - если есть — увеличиваем popularity;
-    - если нет — создаём новую.
+    Пишем запрос сразу в search_queries и search_daily_agg, минуя search_events:
+    ответ POST /search/log — итоговая строка (id, popularity), как и раньше.
+    Горячий путь (/search) идёт через write-behind буфер и компактор.
+    Возвращает строку (RETURNING) с актуальными значениями.
     """
 
     normalized = normalize_query(query)
-    category_id = category.id if category else None
 
-    existing = (
-        db.query(SearchQuery)
-        .filter(
-            SearchQuery.normalized_query == normalized,
-            SearchQuery.category_id.is_(category_id)
-            if category_id is None
-            else SearchQuery.category_id == category_id,
-        )
-        .first()
-    )
-
-    if existing:
-        existing.popularity += 1
-        existing.results_count = results_count
-        existing.source = source
-        if user_id is not None:
-            existing.user_id = user_id
-        db.commit()
-        db.refresh(existing)
-        return existing
-
-    new_q = SearchQuery(
-        query=query,
-        normalized_query=normalized,
-        category_id=category_id,
-        results_count=results_count,
-        popularity=1,
-        source=source,
-        user_id=user_id,
-    )
-    db.add(new_q)
+    event = {
+        "ts": datetime.utcnow(),
+        "query": query,
+        "normalized_query": normalized,
+        "category_id": category.id if category else None,
+        "results_count": results_count,
+        "source": source,
+        "user_id": user_id,
+        **enrich_search_query(normalized),
+    }
+    result = log_search_event_now(db, event)
     db.commit()
-    db.refresh(new_q)
-    return new_q
+
+    search_log_buffer.note_rows(result)
+    return result.rows[0]
 
 
 # ===== /search/categories =====
@@ -654,58 +538,58 @@ def search_categories(
 
 @router.get("/autocomplete", response_model=List[AutocompleteItem])
 def autocomplete(
+    response: Response,
     query: str = Query(..., min_length=1),
     db: Session = Depends(get_db),
 ):
     """
     Автокомплит:
     1) Сначала ищем похожие прошлые запросы (SearchQuery) по префиксу.
+       Если не нашлось ни одного — исправляем опечатку (spell_index) и ищем по исправленному.
     2) Если мало — добавляем подсказки категорий.
+    Все шаги — из памяти (suggest_index / spell_index / category_index), без запросов в БД.
     """
-    q_norm = normalize_query(query)
-    prefix = f"{q_norm}%"
+    timer = start_timer()
+
+    with timer.stage("normalize"):
+        q_norm = normalize_query(query)
 
     suggestions: list[AutocompleteItem] = []
 
-    # 1. Подсказки из прошлых запросов
-    prev_queries = (
-        db.query(SearchQuery)
-        .filter(SearchQuery.normalized_query.ilike(prefix))
-        .order_by(
-            SearchQuery.popularity.desc(),
-            SearchQuery.results_count.desc(),
-            SearchQuery.created_at.desc(),
-        )
-        .limit(10)
-        .all()
-    )
+    # 1. Подсказки из прошлых запросов (top-K по префиксу уже посчитан в trie)
+    with timer.stage("queries"):
+        index = get_suggest_index()
+        for e in top_queries(db, index, q_norm, 10):
+            suggestions.append(
+                AutocompleteItem(
+                    type="query",
+                    value=e.value,
+                    category_id=e.category_id,
+                    slug=e.slug,
+                )
+            )
 
-    for q in prev_queries:
-        suggestions.append(
-            AutocompleteItem(
-                type="query",
-                value=q.query,
-                category_id=q.category_id,
-                slug=q.category.slug if q.category else None,
+    # 1b. По префиксу ничего — вероятно опечатка: исправляем по словарю и ищем ещё раз
+    corrected = None
+    if not suggestions:
+        with timer.stage("spell"):
+            corrected = get_spell_index().correct(q_norm)
+    if corrected:
+        suggestions.append(AutocompleteItem(type="correction", value=corrected))
+        for e in top_queries(db, index, corrected, 9):
+            suggestions.append(
+                AutocompleteItem(
+                    type="query",
+                    value=e.value,
+                    category_id=e.category_id,
+                    slug=e.slug,
+                )
             )
-        )
 
     # 2. Если подсказок меньше 10 — добиваем категориями
     if len(suggestions) < 10:
-        pattern = f"%{q_norm}%"
-        categories = (
-            db.query(Category)
-            .filter(
-                or_(
-                    func.lower(Category.name).ilike(pattern),
-                    func.lower(Category.name_ru).ilike(pattern),
-                    func.lower(Category.keywords).ilike(pattern),
-                )
-            )
-            .order_by(Category.name.asc())
-            .limit(10 - len(suggestions))
-            .all()
-        )
+        with timer.stage("category"):
+            categories = get_category_index(db).search(corrected or q_norm, 10 - len(suggestions))
 
         for cat in categories:
             suggestions.append(
@@ -717,6 +601,7 @@ def autocomplete(
                 )
             )
 
+    timer.finish(response, "autocomplete")
     return suggestions
 
 
@@ -759,89 +644,50 @@ def log_search_endpoint(
 
 # ===== /search/stats =====
 
-@router.get("/stats", response_model=SearchStatsOut)
-def search_stats(
-    limit: int = 20,
-    db: Session = Depends(get_db),
-):
-    """
-    Возвращает статистику поиска:
-    - Топ популярных запросов (кластеризованных по normalized_query + category_id)
-    - Топ категорий
-    - Пустые (0 результатов) запросы
-    """
-
-    # --- Топ запросов (кластеризация по normalized_query + category_id) ---
-    raw_queries = (
-        db.query(SearchQuery)
+def _stats_top_queries(db: Session, limit: int) -> List[SearchStatItem]:
+    # кластер = (normalized_query, category_id); витрина — самая свежая запись кластера
+    agg = (
+        db.query(
+            SearchQuery.normalized_query.label("normalized_query"),
+            SearchQuery.category_id.label("category_id"),
+            func.max(SearchQuery.id).label("rep_id"),
+            func.coalesce(func.sum(SearchQuery.results_count), 0).label("results_count"),
+            func.coalesce(func.sum(SearchQuery.popularity), 0).label("popularity"),
+            func.max(SearchQuery.created_at).label("created_at"),
+        )
+        .group_by(SearchQuery.normalized_query, SearchQuery.category_id)
         .order_by(
-            SearchQuery.popularity.desc(),
-            SearchQuery.created_at.desc(),
+            func.sum(SearchQuery.popularity).desc(),
+            func.max(SearchQuery.created_at).desc(),
         )
-        .limit(200)  # берём побольше, потом режем после агрегации
-        .all()
+        .limit(limit)
+        .subquery()
     )
+    rep = aliased(SearchQuery)
 
-    # ключ = (normalized_query, category_id)
-    clusters: Dict[tuple, dict] = {}
-
-    for q in raw_queries:
-        key = (q.normalized_query, q.category_id)
-
-        if key not in clusters:
-            clusters[key] = {
-                "id": q.id,
-                "query": q.query,
-                "normalized_query": q.normalized_query,
-                "category_id": q.category_id,
-                "category": q.category,  # сам объект Category (может быть None)
-                "results_count": 0,
-                "popularity": 0,
-                "source": q.source,
-                "created_at": q.created_at,
-            }
-
-        agg = clusters[key]
-        agg["results_count"] += q.results_count
-        agg["popularity"] += q.popularity
-
-        # самый свежий запрос в кластере
-        if q.created_at > agg["created_at"]:
-            agg["created_at"] = q.created_at
-            agg["query"] = q.query
-            agg["source"] = q.source
-
-    # сортируем кластеры:
-    # 1) по суммарной популярности
-    # 2) по свежести (created_at)
-    sorted_clusters = sorted(
-        clusters.values(),
-        key=lambda x: (x["popularity"], x["created_at"]),
-        reverse=True,
+    rows = (
+        db.query(
+            agg.c.rep_id.label("id"),
+            rep.query,
+            agg.c.normalized_query,
+            agg.c.category_id,
+            Category.slug.label("category_slug"),
+            Category.name.label("category_name"),
+            agg.c.results_count,
+            agg.c.popularity,
+            rep.source,
+            agg.c.created_at,
+        )
+        .join(rep, rep.id == agg.c.rep_id)
+        .outerjoin(Category, Category.id == agg.c.category_id)
+        .order_by(agg.c.popularity.desc(), agg.c.created_at.desc())
+        .all()
     )
+    return [SearchStatItem(**row._mapping) for row in rows]
 
-    # режем до limit
-    top_clusters = sorted_clusters[:limit]
-
-    # маппим в Pydantic-модель
-    top_queries: List[SearchStatItem] = [
-        SearchStatItem(
-            id=cl["id"],
-            query=cl["query"],
-            normalized_query=cl["normalized_query"],
-            category_id=cl["category_id"],
-            category_slug=cl["category"].slug if cl["category"] else None,
-            category_name=cl["category"].name if cl["category"] else None,
-            results_count=cl["results_count"],
-            popularity=cl["popularity"],
-            source=cl["source"],
-            created_at=cl["created_at"],
-        )
-        for cl in top_clusters
-    ]
 
-    # --- Топ категорий ---
-    top_categories_rows = (
+def _stats_top_categories(db: Session, limit: int) -> List[CategoryStatItem]:
+    rows = (
         db.query(
             Category.id.label("category_id"),
             Category.slug.label("category_slug"),
@@ -854,256 +700,68 @@ def search_stats(
         .limit(limit)
         .all()
     )
+    return [CategoryStatItem(**row._mapping) for row in rows]
 
-    top_categories: List[CategoryStatItem] = [
-        CategoryStatItem(
-            category_id=row.category_id,
-            category_slug=row.category_slug,
-            category_name=row.category_name,
-            total_searches=row.total_searches,
-        )
-        for row in top_categories_rows
-    ]
 
-    # --- Пустые запросы (0 результатов) ---
-    empty_queries_rows = (
-        db.query(SearchQuery)
+def _stats_empty_queries(db: Session, limit: int) -> List[EmptyQueryItem]:
+    rows = (
+        db.query(
+            SearchQuery.id,
+            SearchQuery.query,
+            SearchQuery.normalized_query,
+            SearchQuery.created_at,
+        )
         .filter(SearchQuery.results_count == 0)
         .order_by(SearchQuery.created_at.desc())
         .limit(limit)
         .all()
     )
+    return [EmptyQueryItem(**row._mapping) for row in rows]
 
-    empty_queries: List[EmptyQueryItem] = [
-        EmptyQueryItem(
-            id=q.id,
-            query=q.query,
-            normalized_query=q.normalized_query,
-            created_at=q.created_at,
-        )
-        for q in empty_queries_rows
-    ]
 
-    # ВАЖНО: всегда возвращаем объект SearchStatsOut, а не None
-    return SearchStatsOut(
-        top_queries=top_queries,
-        top_categories=top_categories,
-        empty_queries=empty_queries,
-    )
-
-
-    # ---- Топ категорий ----
-
-    top_categories_query = (
+def _stats_top_brands(db: Session, limit: int) -> List[BrandStatItem]:
+    rows = (
         db.query(
-            Category.id.label("category_id"),
+            func.lower(SearchQuery.normalized_query).label("brand"),
             Category.slug.label("category_slug"),
-            Category.name.label("category_name"),
             func.count(SearchQuery.id).label("total_searches"),
+            func.coalesce(func.sum(SearchQuery.results_count), 0).label("total_results"),
+            func.coalesce(func.sum(SearchQuery.popularity), 0).label("total_popularity"),
+            func.min(SearchQuery.created_at).label("first_seen"),
+            func.max(SearchQuery.created_at).label("last_seen"),
         )
-        .join(SearchQuery, SearchQuery.category_id == Category.id)
-    )
-
-    if date_from_dt:
-        top_categories_query = top_categories_query.filter(
-            SearchQuery.created_at >= date_from_dt
-        )
-    if date_to_dt:
-        top_categories_query = top_categories_query.filter(
-            SearchQuery.created_at < date_to_dt
+        .outerjoin(Category, Category.id == SearchQuery.category_id)
+        .group_by(func.lower(SearchQuery.normalized_query), Category.slug)
+        .order_by(
+            func.count(SearchQuery.id).desc(),          # A: по числу поисков
+            func.sum(SearchQuery.popularity).desc(),    # B: по суммарной популярности
+            func.max(SearchQuery.created_at).desc(),    # C: по свежести
         )
-
-    top_categories_orm = (
-        top_categories_query
-        .group_by(Category.id, Category.slug, Category.name)
-        .order_by(func.count(SearchQuery.id).desc())
         .limit(limit)
         .all()
     )
+    return [BrandStatItem(**row._mapping) for row in rows]
 
-    top_categories = [
-        CategoryStatItem(
-            category_id=row.category_id,
-            category_slug=row.category_slug,
-            category_name=row.category_name,
-            total_searches=row.total_searches,
-        )
-        for row in top_categories_orm
-    ]
-
-    # ---- Пустые запросы (0 результатов) ----
-
-    empty_queries_query = (
-        db.query(SearchQuery)
-        .filter(SearchQuery.results_count == 0)
-    )
-
-    if date_from_dt:
-        empty_queries_query = empty_queries_query.filter(
-            SearchQuery.created_at >= date_from_dt
-        )
-    if date_to_dt:
-        empty_queries_query = empty_queries_query.filter(
-            SearchQuery.created_at < date_to_dt
-        )
-
-    empty_queries_orm = (
-        empty_queries_query
-        .order_by(SearchQuery.created_at.desc())
-        .limit(limit)
-        .all()
-    )
 
 @router.get("/stats", response_model=SearchStatsOut)
 def search_stats(
-    limit: int = 20,
+    limit: int = Query(20, ge=1, le=200),
     db: Session = Depends(get_db),
 ):
     """
     Возвращает статистику поиска:
-    - Топ популярных запросов
+    - Топ популярных запросов (кластеры normalized_query + category_id, GROUP BY в БД)
     - Топ категорий
     - Пустые (0 результатов) запросы
     - Топ брендов
-    """
-
-    # --- Топ запросов (кластеризация по normalized_query + category_id) ---
-    raw_queries = (
-        db.query(SearchQuery)
-        .order_by(SearchQuery.popularity.desc(), SearchQuery.created_at.desc())
-        .limit(200)
-        .all()
-    )
-
-    clusters: Dict[tuple, dict] = {}
-
-    for q in raw_queries:
-        key = (q.normalized_query, q.category_id)
-
-        if key not in clusters:
-            clusters[key] = {
-                "id": q.id,
-                "query": q.query,
-                "normalized_query": q.normalized_query,
-                "category_id": q.category_id,
-                "category": q.category,
-                "results_count": 0,
-                "popularity": 0,
-                "source": q.source,
-                "created_at": q.created_at,
-            }
-
-        agg = clusters[key]
-        agg["results_count"] += q.results_count
-        agg["popularity"] += q.popularity
-
-        if q.created_at > agg["created_at"]:
-            agg["created_at"] = q.created_at
-            agg["query"] = q.query
-            agg["source"] = q.source
-
-    sorted_clusters = sorted(
-        clusters.values(),
-        key=lambda x: (x["popularity"], x["created_at"]),
-        reverse=True,
-    )
-
-    top_clusters = sorted_clusters[:limit]
-
-    top_queries = [
-        SearchQueryOut(
-            id=cl["id"],
-            query=cl["query"],
-            normalized_query=cl["normalized_query"],
-            category_id=cl["category_id"],
-            category_slug=cl["category"].slug if cl["category"] else None,
-            category_name=cl["category"].name if cl["category"] else None,
-            results_count=cl["results_count"],
-            popularity=cl["popularity"],
-            source=cl["source"],
-            created_at=cl["created_at"],
-        )
-        for cl in top_clusters
-    ]
-
-    # --- Топ категорий ---
-    top_categories_orm = (
-        db.query(
-            Category.id.label("category_id"),
-            Category.slug.label("category_slug"),
-            Category.name.label("category_name"),
-            func.count(SearchQuery.id).label("total_searches"),
-        )
-        .join(SearchQuery, SearchQuery.category_id == Category.id)
-        .group_by(Category.id, Category.slug, Category.name)
-        .order_by(func.count(SearchQuery.id).desc())
-        .limit(limit)
-        .all()
-    )
-
-    top_categories = [
-        CategoryStatItem(
-            category_id=row.category_id,
-            category_slug=row.category_slug,
-            category_name=row.category_name,
-            total_searches=row.total_searches,
-        )
-        for row in top_categories_orm
-    ]
-
-    # --- Пустые (0 результатов) запросы ---
-    empty_queries_orm = (
-        db.query(SearchQuery)
-        .filter(SearchQuery.results_count == 0)
-        .order_by(SearchQuery.created_at.desc())
-        .limit(limit)
-        .all()
-    )
-
-    empty_queries = [
-        EmptyQueryItem(
-            id=q.id,
-            query=q.query,
-            normalized_query=q.normalized_query,
-            created_at=q.created_at,
-        )
-        for q in empty_queries_orm
-    ]
 
-    # --- Топ брендов ---
-    brand_rows = (
-        db.query(
-            func.lower(SearchQuery.normalized_query).label("brand"),
-            Category.slug.label("category_slug"),
-            func.count(SearchQuery.id).label("total_searches"),
-            func.sum(SearchQuery.results_count).label("total_results"),
-            func.sum(SearchQuery.popularity_score).label("total_popularity"),
-            func.min(SearchQuery.created_at).label("first_seen"),
-            func.max(SearchQuery.created_at).label("last_seen"),
-        )
-        .outerjoin(Category, Category.id == SearchQuery.category_id)
-        .group_by(SearchQuery.normalized_query, Category.slug)
-        .order_by(
-        func.count(SearchQuery.id).desc(),              # A: по числу поисков
-        func.sum(SearchQuery.popularity_score).desc(),  # B: по суммарному score
-        func.max(SearchQuery.created_at).desc(),        # C: по свежести
-    )
-    .limit(limit)
-    .all()
-    )
-
-    top_brands = [
-        BrandStatItem(
-            brand=row.brand,
-            category_slug=row.category_slug,
-            total_searches=row.total_searches,
-            total_results=row.total_results or 0,
-            total_popularity=row.total_popularity or 0,
-            first_seen=row.first_seen,
-            last_seen=row.last_seen,
-        )
-        for row in brand_rows
-    ]
+    Каждая часть — один SQL-запрос с агрегацией в БД; все четыре идут
+    по одному соединению сессии запроса, пул не расходуется на потоки.
+    """
+    top_queries = _stats_top_queries(db, limit)
+    top_categories = _stats_top_categories(db, limit)
+    empty_queries = _stats_empty_queries(db, limit)
+    top_brands = _stats_top_brands(db, limit)
 
     return SearchStatsOut(
         top_queries=top_queries,
@@ -1128,44 +786,22 @@ def top_brands(
 
     since = datetime.utcnow() - timedelta(days=days)
 
-    # Берём только normalized_query за период
+    # brand / brand_score заполняются при логировании (enrich_search_query)
     rows = (
-        db.query(SearchQuery.normalized_query)
-        .filter(SearchQuery.created_at >= since)
+        db.query(SearchQuery.brand, func.count(SearchQuery.id).label("count"))
+        .filter(
+            SearchQuery.created_at >= since,
+            SearchQuery.brand.is_not(None),
+            SearchQuery.brand_score >= min_score,
+        )
+        .group_by(SearchQuery.brand)
+        .order_by(func.count(SearchQuery.id).desc())
+        .limit(limit)
         .all()
     )
 
-    brand_counter: Dict[str, int] = {}
-
-    for (q,) in rows:
-        if not q:
-            continue
+    return [{"brand": r.brand, "count": r.count} for r in rows]
 
-        # extract_brand может вернуть:
-        # 1) "Apple" (строка)
-        # 2) ("Apple", 0.83) (кортеж)
-        res = extract_brand(q)
-
-        brand: Optional[str] = None
-        score: float = 1.0
-
-        if isinstance(res, tuple) and len(res) >= 2:
-            brand, score = res[0], float(res[1])
-        else:
-            brand = res
-
-        if not brand:
-            continue
-
-        if score < min_score:
-            continue
-
-        brand_counter[brand] = brand_counter.get(brand, 0) + 1
-
-    sorted_brands = sorted(brand_counter.items(), key=lambda x: x[1], reverse=True)
-
-    return [{"brand": brand, "count": count} for brand, count in sorted_brands[:limit]]
-    
 @router.get("/brands", response_model=List[BrandStatItem])
 def search_brands(
     category_slug: Optional[str] = Query(
@@ -1232,6 +868,7 @@ def search_brands(
             func.max(SearchQuery.created_at).desc(),
         )
     elif sort_by == "popularity":
+        # затухающая популярность: недавние поиски весят больше старых
         q = q.order_by(
             func.sum(SearchQuery.popularity_score).desc(),
             func.count(SearchQuery.id).desc(),
@@ -1255,7 +892,8 @@ def search_brands(
             category_slug=row.category_slug,
             total_searches=row.total_searches,
             total_results=row.total_results,
-            total_popularity=row.total_popularity,
+            # сумма popularity_score -> затухшее число поисков на сейчас
+            total_popularity=round(current_score(row.total_popularity)),
             first_seen=row.first_seen,
             last_seen=row.last_seen,
         )
@@ -1283,22 +921,19 @@ def search_trends(
 
     # определяем стартовую дату с учётом periods_back
     if period == "week":
-        # начинаем с начала недели N периодов назад
-        start_date = now - timedelta(weeks=periods_back)
-        bucket_expr = func.date_trunc("week", SearchQuery.created_at)
+        start_day = (now - timedelta(weeks=periods_back)).date()
     else:  # "month"
-        start_date = now - timedelta(days=30 * periods_back)
-        bucket_expr = func.date_trunc("month", SearchQuery.created_at)
+        start_day = (now - timedelta(days=30 * periods_back)).date()
 
-    # 1) сначала найдём топ normalized_query за период, чтобы не тащить всю базу
+    # 1) топ normalized_query за период — из дневного rollup, а не из сырых search_queries
     top_rows = (
         db.query(
-            SearchQuery.normalized_query,
-            func.sum(SearchQuery.popularity).label("score"),
+            SearchDailyAgg.normalized_query,
+            func.sum(SearchDailyAgg.popularity).label("score"),
         )
-        .filter(SearchQuery.created_at >= start_date)
-        .group_by(SearchQuery.normalized_query)
-        .order_by(func.sum(SearchQuery.popularity).desc())
+        .filter(SearchDailyAgg.day >= start_day)
+        .group_by(SearchDailyAgg.normalized_query)
+        .order_by(func.sum(SearchDailyAgg.popularity).desc())
         .limit(limit_queries)
         .all()
     )
@@ -1309,48 +944,46 @@ def search_trends(
 
     top_normalized = [r.normalized_query for r in top_rows]
 
-    # 2) агрегируем по периодам только для этих топ-запросов
+    # 2) дневные точки только для этих топ-запросов
     agg_rows = (
         db.query(
-            SearchQuery.normalized_query.label("normalized_query"),
-            bucket_expr.label("bucket_start"),
-            func.sum(SearchQuery.popularity).label("total_popularity"),
-            func.sum(SearchQuery.results_count).label("total_results"),
+            SearchDailyAgg.normalized_query,
+            SearchDailyAgg.day,
+            func.sum(SearchDailyAgg.popularity).label("total_popularity"),
+            func.sum(SearchDailyAgg.results).label("total_results"),
         )
         .filter(
-            SearchQuery.created_at >= start_date,
-            SearchQuery.normalized_query.in_(top_normalized),
+            SearchDailyAgg.day >= start_day,
+            SearchDailyAgg.normalized_query.in_(top_normalized),
         )
-        .group_by("normalized_query", "bucket_start")
-        .order_by("normalized_query", "bucket_start")
+        .group_by(SearchDailyAgg.normalized_query, SearchDailyAgg.day)
         .all()
     )
 
-    # 3) собираем структуру normalized_query -> [points ...]
-    trends_map: Dict[str, List[TrendPointOut]] = {}
+    # 3) дни -> недели / месяцы: normalized_query -> {period_start -> [popularity, results]}
+    trends_map: Dict[str, Dict[date, List[int]]] = {nq: {} for nq in top_normalized}
 
     for row in agg_rows:
-        nq = row.normalized_query
-        if nq not in trends_map:
-            trends_map[nq] = []
-
-        trends_map[nq].append(
-            TrendPointOut(
-                period_start=row.bucket_start,
-                total_popularity=row.total_popularity,
-                total_results=row.total_results,
-            )
-        )
+        ps = period_start(as_date(row.day), period)
+        point = trends_map[row.normalized_query].setdefault(ps, [0, 0])
+        point[0] += row.total_popularity or 0
+        point[1] += row.total_results or 0
 
-    # 4) преобразуем в список QueryTrendOut
+    # 4) преобразуем в список QueryTrendOut (в порядке топа)
     query_trends: List[QueryTrendOut] = []
-    for nq, points in trends_map.items():
-        # сортируем точки по времени на всякий случай
-        points_sorted = sorted(points, key=lambda p: p.period_start)
+    for nq in top_normalized:
+        points = trends_map[nq]
         query_trends.append(
             QueryTrendOut(
                 normalized_query=nq,
-                points=points_sorted,
+                points=[
+                    TrendPointOut(
+                        period_start=datetime(ps.year, ps.month, ps.day),
+                        total_popularity=pop,
+                        total_results=res,
+                    )
+                    for ps, (pop, res) in sorted(points.items())
+                ],
             )
         )
 
@@ -1388,62 +1021,56 @@ def brand_trends(
     по неделям или месяцам.
     """
 
-    # --- вспомогательная функция для начала периода ---
-    def get_period_start(dt: datetime) -> datetime:
-        dt = dt.replace(hour=0, minute=0, second=0, microsecond=0)
-        if period == "week":
-            # понедельник текущей недели
-            return dt - timedelta(days=dt.weekday())
-        else:
-            # первое число месяца
-            return dt.replace(day=1)
-
     # --- определяем с какой даты брать данные ---
     now = datetime.utcnow()
     if period == "week":
-        start_date = now - timedelta(weeks=periods_back)
+        start_day = (now - timedelta(weeks=periods_back)).date()
     else:
         # грубо: periods_back месяцев назад
-        start_date = now - timedelta(days=30 * periods_back)
-
-    # --- базовый запрос по логам поиска ---
-    query = db.query(SearchQuery)
+        start_day = (now - timedelta(days=30 * periods_back)).date()
 
-    # фильтруем по дате
-    query = query.filter(SearchQuery.created_at >= start_date)
+    # --- GROUP BY (brand, category, день) по дневному rollup ---
+    query = (
+        db.query(
+            SearchDailyAgg.brand,
+            Category.slug.label("category_slug"),
+            SearchDailyAgg.day,
+            func.sum(SearchDailyAgg.searches).label("total_searches"),
+            func.sum(SearchDailyAgg.results).label("total_results"),
+            func.sum(SearchDailyAgg.popularity).label("total_popularity"),
+        )
+        .filter(
+            SearchDailyAgg.day >= start_day,
+            SearchDailyAgg.brand.is_not(None),
+        )
+    )
 
     # фильтр по категории (если передан)
     if category_slug:
         query = (
             query
-            .join(Category)
+            .join(Category, Category.id == SearchDailyAgg.category_id)
             .filter(Category.slug == category_slug)
         )
     else:
-        query = query.outerjoin(Category)
+        query = query.outerjoin(Category, Category.id == SearchDailyAgg.category_id)
 
-    rows = query.all()
+    rows = query.group_by(SearchDailyAgg.brand, Category.slug, SearchDailyAgg.day).all()
 
     # если логов нет — возвращаем пустой объект
     if not rows:
         return BrandTrendsOut(period=period, brands=[])
 
-    # --- агрегация по (brand, category_slug, period_start) ---
+    # --- дни -> недели / месяцы (строк не больше, чем брендов * дней) ---
     # ключ: (brand, category_slug)
     # значение: dict[period_start -> агрегаты]
     buckets: Dict[Tuple[str, Optional[str]], Dict[datetime, dict]] = {}
 
     for r in rows:
-        cat_slug = r.category.slug if r.category else None
+        d = period_start(as_date(r.day), period)
+        ps = datetime(d.year, d.month, d.day)
 
-        # используем уже существующую функцию детекции бренда
-        brand = detect_brand_from_query(r.query, cat_slug)
-        if not brand:
-            continue  # пропускаем запросы без бренда
-
-        ps = get_period_start(r.created_at)
-
-        key = (brand, cat_slug)
+        key = (r.brand, r.category_slug)
         if key not in buckets:
             buckets[key] = {}
 
@@ -1455,9 +1082,9 @@ def brand_trends(
             }
 
         agg = buckets[key][ps]
-        agg["total_searches"] += 1
-        agg["total_results"] += r.results_count
-        agg["total_popularity"] += r.popularity
+        agg["total_searches"] += r.total_searches or 0
+        agg["total_results"] += r.total_results or 0
+        agg["total_popularity"] += r.total_popularity or 0
 
     if not buckets:
         return BrandTrendsOut(period=period, brands=[])
@@ -1517,36 +1144,28 @@ def top_models(
 ):
     since = datetime.utcnow() - timedelta(days=days)
 
-    q = db.query(SearchQuery.normalized_query, SearchQuery.category_id).filter(
-        SearchQuery.created_at >= since
+    q = (
+        db.query(SearchQuery.brand, SearchQuery.model, func.count(SearchQuery.id).label("count"))
+        .filter(
+            SearchQuery.created_at >= since,
+            SearchQuery.model.is_not(None),
+            SearchQuery.brand_score >= min_score,
+        )
     )
 
+    if brand is not None:
+        q = q.filter(func.lower(SearchQuery.brand) == brand.lower())
+
     if category_slug is not None:
         q = q.join(Category, Category.id == SearchQuery.category_id).filter(Category.slug == category_slug)
 
-    rows = q.all()
-
-    counter = Counter()
-
-    for (normalized_query, _cat_id) in rows:
-        if not normalized_query:
-            continue
-
-        b, score = extract_brand(normalized_query)
-        if not b or score < min_score:
-            continue
-
-        if brand is not None and b.lower() != brand.lower():
-            continue
-
-        model = extract_model_from_query(normalized_query, b)
-        if not model:
-            continue
-
-        counter[(b, model)] += 1
-
-    top = counter.most_common(limit)
-    return [{"brand": b, "model": m, "count": c} for (b, m), c in top]
+    rows = (
+        q.group_by(SearchQuery.brand, SearchQuery.model)
+        .order_by(func.count(SearchQuery.id).desc())
+        .limit(limit)
+        .all()
+    )
+    return [{"brand": r.brand, "model": r.model, "count": r.count} for r in rows]
 
 
 
@@ -1561,122 +1180,200 @@ def auto_keywords(
     Полуавтоматическое пополнение keywords у категорий из search_queries.
 
     - Если category_slug указан — работаем только по одной категории.
-    - Если нет — пробегаем по всем категориям, у которых есть запросы.
+    - Если нет — все категории, у которых есть запросы, за один запрос к БД
+      и один UPDATE изменившихся.
     """
 
-    updated: Dict[str, int] = {}
-
-    # Соберём список категорий, по которым есть запросы
-    q = db.query(SearchQuery.category_id).filter(SearchQuery.category_id.is_not(None))
+    # Топ-N запросов каждой категории одним запросом (оконная функция)
+    # + текущие keywords категории тем же round-trip.
+    rn = func.row_number().over(
+        partition_by=SearchQuery.category_id,
+        order_by=(SearchQuery.popularity.desc(), SearchQuery.id),
+    ).label("rn")
+    top = (
+        select(SearchQuery.category_id, SearchQuery.normalized_query, rn)
+        .where(
+            SearchQuery.category_id.is_not(None),
+            SearchQuery.popularity >= min_popularity,
+        )
+    )
     if category_slug:
-        cat = db.query(Category).filter(Category.slug == category_slug).first()
-        if not cat:
-            return AutoKeywordsOut(updated_categories={})
-        q = q.filter(SearchQuery.category_id == cat.id)
-
-    category_ids = {row[0] for row in q.distinct().all()}
-
-    if category_slug and category_ids and len(category_ids) == 1:
-        categories = [cat]
-    else:
-        categories = db.query(Category).filter(Category.id.in_(category_ids)).all()
-
-    for cat in categories:
-        # Топ запросы по категории
-        top_queries = (
-            db.query(SearchQuery.normalized_query, SearchQuery.popularity)
-            .filter(
-                SearchQuery.category_id == cat.id,
-                SearchQuery.popularity >= min_popularity,
-            )
-            .order_by(SearchQuery.popularity.desc())
-            .limit(limit_per_category)
-            .all()
+        top = top.where(
+            SearchQuery.category_id.in_(select(Category.id).where(Category.slug == category_slug))
         )
-
-        if not top_queries:
-            continue
-
-        # Текущие keywords
-        existing = set()
-        if cat.keywords:
-            for part in cat.keywords.split(","):
+    top = top.subquery()
+
+    rows = db.execute(
+        select(Category.id, Category.slug, Category.keywords, top.c.normalized_query)
+        .join(top, top.c.category_id == Category.id)
+        .where(top.c.rn <= limit_per_category)
+        .order_by(Category.id, top.c.rn)
+    ).all()
+
+    # Слияние с текущими keywords в памяти
+    merged: Dict[int, dict] = {}
+    for cat_id, slug, keywords, nq in rows:
+        m = merged.get(cat_id)
+        if m is None:
+            existing = set()
+            for part in (keywords or "").split(","):
                 part = part.strip().lower()
                 if part:
                     existing.add(part)
+            m = merged[cat_id] = {"slug": slug, "existing": existing, "added": 0}
 
-        added = 0
-        for nq, pop in top_queries:
-            kw = nq.strip().lower()
-            if not kw or kw in existing:
-                continue
-            existing.add(kw)
-            added += 1
-
-        if added > 0:
-            cat.keywords = ", ".join(sorted(existing))
-            updated[cat.slug] = added
-
-    if updated:
+        kw = (nq or "").strip().lower()
+        if not kw or kw in m["existing"]:
+            continue
+        m["existing"].add(kw)
+        m["added"] += 1
+
+    changed = [(cat_id, m) for cat_id, m in merged.items() if m["added"]]
+    updated: Dict[str, int] = {m["slug"]: m["added"] for _, m in changed}
+
+    if changed:
+        # bulk UPDATE по PK одним executemany; ORM-события при этом не срабатывают,
+        # поэтому индекс категорий сбрасываем сами
+        db.execute(
+            update(Category),
+            [{"id": cat_id, "keywords": ", ".join(sorted(m["existing"]))} for cat_id, m in changed],
+        )
         db.commit()
+        invalidate_category_index()
 
     return AutoKeywordsOut(updated_categories=updated)
 
+SEARCH_PAGE_SIZE = 50
+
+
+class SearchItemOut(BaseModel):
+    external_id: str
+    title: Optional[str] = None
+    url: str
+    location: Optional[str] = None
+    category: Optional[str] = None
+    price: Optional[float] = None
+    currency: Optional[str] = None
+
+
+# схема собирается один раз при импорте, а не на каждый запрос
+SEARCH_ITEMS_ADAPTER = TypeAdapter(List[SearchItemOut])
+
+
 @router.post("", response_model=dict)
 def search(
+    response: Response,
     query: str = Query(..., min_length=1),
+    page: int = Query(1, ge=1, le=100),
+    count: Literal["exact", "capped", "estimate"] = Query(
+        "capped",
+        description=(
+            "exact — полный count(); capped — не больше count_cap (\"N+\"); "
+            "estimate — оценка планировщика Postgres (на SQLite = capped)."
+        ),
+    ),
+    count_cap: int = Query(1000, ge=1, le=100000),
     db: Session = Depends(get_db),
 ):
-    normalized = query.strip().lower()
-
-    # 1) Реальный поиск (вариант 2: категории + бренды)
-    category = detect_category_from_query(db, normalized)   # должна быть функция в файле
-    brand, brand_score = extract_brand(normalized)      # должна быть функция в файле
+    timer = start_timer()
 
-    q = db.query(OlxAd)  # OlxAd должен быть импортирован/виден в файле
+    with timer.stage("normalize"):
+        normalized = normalize_query(query)
 
-    if category:
-        q = q.filter(OlxAd.category.ilike(f"%{category.name}%"))
+    # 1) Реальный поиск (вариант 2: категории + бренды)
+    with timer.stage("category"):
+        category = detect_category_from_query(db, normalized)   # должна быть функция в файле
+    with timer.stage("brand"):
+        brand, brand_score = extract_brand(normalized)      # должна быть функция в файле
+
+    # Горячие запросы ("айфон", "квартира") отдаём из кэша, пока не пришли новые объявления
+    cache_key = (normalized, category.id if category else None, brand, page, count, count_cap)
+    with timer.stage("cache"):
+        generation = search_cache.sync_generation(db)
+        result = search_cache.get(cache_key)
+    cached = result is not None
+
+    if not cached:
+        q = search_ads(
+            db,
+            query=normalized,
+            brand=brand,
+            category_name=category.name if category else None,
+        )
 
-    if brand:
-        q = q.filter(OlxAd.title.ilike(f"%{brand}%"))
+        # Важно: count ДО limit. Точный count стоит как весь скан -> по умолчанию capped
+        count_mode = count
+        results_count = None
+        capped = False
+        with timer.stage("count"):
+            if count_mode == "estimate":
+                results_count = estimated_count(q)
+                if results_count is None:
+                    count_mode = "capped"
+            if count_mode == "capped":
+                results_count, capped = capped_count(q, count_cap)
+            elif count_mode == "exact":
+                results_count = q.count()
+
+        if capped:
+            results_count_label = f"{results_count}+"
+        elif count_mode == "estimate":
+            results_count_label = f"~{results_count}"
+        else:
+            results_count_label = str(results_count)
+
+        with timer.stage("fetch"):
+            rows = (
+                q.with_entities(*search_item_columns())
+                .offset((page - 1) * SEARCH_PAGE_SIZE)
+                .limit(SEARCH_PAGE_SIZE)
+                .all()
+            )
 
-    # Важно: count ДО limit
-    results_count = q.count()
-    results = q.limit(50).all()
+        with timer.stage("serialize"):
+            items = SEARCH_ITEMS_ADAPTER.dump_python(
+                SEARCH_ITEMS_ADAPTER.validate_python(rows, from_attributes=True),
+                mode="json",
+            )
 
-    # 2) Аналитика поиска
-    sq = (
-        db.query(SearchQuery)
-        .filter(SearchQuery.normalized_query == normalized)
-        .order_by(SearchQuery.created_at.desc())
-        .first()
-    )
+        result = {
+            "results_count": results_count,
+            "results_count_mode": count_mode,
+            "results_count_capped": capped,
+            "results_count_label": results_count_label,
+            # уже JSON-совместимые dict-ы: ни ORM-объектов, ни повторной сериализации на хитах кэша
+            "items": items,
+        }
+        search_cache.set(cache_key, result, generation)
 
-    if sq:
-        sq.popularity = (sq.popularity or 0) + 1
-        sq.results_count = results_count
-        sq.source = "api"
-        sq.query = query
-    else:
-        sq = SearchQuery(
+    # 2) Аналитика поиска: write-behind, в БД уйдёт пачкой из фонового потока
+    with timer.stage("log"):
+        popularity = search_log_buffer.add(
             query=query,
             normalized_query=normalized,
-            results_count=results_count,
-            popularity=1,
+            results_count=result["results_count"],
             source="api",
+            **enrich_search_query(normalized),
         )
-        db.add(sq)
 
-    db.commit()
-    db.refresh(sq)
+    # 3) "Возможно, вы искали": только хэш-поиски по словарю опечаток
+    with timer.stage("spell"):
+        did_you_mean = get_spell_index().correct(normalized)
+
+    timer.finish(response, "search")
 
     return {
         "query": query,
         "normalized": normalized,
-        "results_count": results_count,
-        "popularity": sq.popularity,
-        "items": results,
+        "did_you_mean": did_you_mean,
+        "page": page,
+        "cached": cached,
+        "results_count": result["results_count"],
+        "results_count_mode": result["results_count_mode"],
+        "results_count_capped": result["results_count_capped"],
+        "results_count_label": result["results_count_label"],
+        "popularity": popularity,
+        "items": result["items"],
         }
 
 @router.get("/suggestions", response_model=dict)
@@ -1685,88 +1382,49 @@ def suggest(
     limit: int = Query(8, ge=1, le=20),
     db: Session = Depends(get_db),
 ):
-    nq = query.strip().lower()
+    """
+    Подсказки по префиксу из in-memory trie:
+    сначала прошлые запросы (по popularity), потом названия категорий и AI-подсказки.
+    """
+    nq = normalize_query(query)
 
-    rows = (
-        db.query(SearchQuery)
-        .filter(SearchQuery.normalized_query.ilike(f"{nq}%"))
-        .order_by(SearchQuery.popularity.desc(), SearchQuery.created_at.desc())
-        .limit(limit)
-        .all()
-    )
+    index = get_suggest_index()
+    entries = top_queries(db, index, nq, limit)
+    if len(entries) < limit:
+        entries += index.top(nq, TOP_K, kinds={KIND_CATEGORY, KIND_HINT})
 
-    return {
-        "query": query,
-        "normalized": nq,
-        "items": [
+    items = []
+    seen = set()
+    for e in entries:
+        if e.normalized in seen:
+            continue
+        seen.add(e.normalized)
+        items.append(
             {
-                "query": r.query,
-                "normalized_query": r.normalized_query,
-                "popularity": r.popularity or 0,
-                "results_count": r.results_count or 0,
+                "query": e.value,
+                "normalized_query": e.normalized,
+                "popularity": e.popularity,
+                "results_count": e.results_count,
             }
-            for r in rows
-        ],
-    }
-
-@router.get("/suggestions")
-def get_suggestions(
-    query: str,
-    limit: int = 5,
-    db: Session = Depends(get_db),
-):
-    # Продвинутая нормализация (айф → айфон, ноут → ноутбук и т.д.)
-    q_norm = normalize_query_advanced(query)
-
-    items = []
-
-    # 1. Подсказки из прошлых запросов (SearchQuery)
-    prev = (
-    db.query(SearchQuery)
-    .filter(
-        SearchQuery.normalized_query.ilike(f"{q_norm}%"),
-        SearchQuery.created_at >= cutoff,
-    )
-    .order_by(
-        SearchQuery.popularity.desc(),
-        SearchQuery.results_count.desc(),
-        SearchQuery.created_at.desc(),
-    )
-    .limit(limit)
-    .all()
-    )
-
-    for p in prev:
-        if p.normalized_query and p.normalized_query not in items:
-            items.append(p.normalized_query)
-
-    # 2. Подсказки из категорий (name / name_ru / slug)
-    cats = (
-        db.query(Category)
-        .filter(
-            or_(
-                Category.name.ilike(f"%{query}%"),
-                Category.name_ru.ilike(f"%{query}%"),
-                Category.slug.ilike(f"{q_norm}%"),
-                Category.keywords.ilike(f"%{q_norm}%"),
-            )
         )
-        .limit(limit)
-        .all()
-    )
+        if len(items) >= limit:
+            break
 
-    for c in cats:
-        name = c.name_ru or c.name
-        if name and name not in items:
-            items.append(name)
-
-    # 3. AI-подсказки на основе нормализованного ключа
-    items = ai_hints(q_norm, items, limit)
-
-    # На всякий случай ещё раз ограничим длину
-    items = items[:limit]
+    # AI-подсказки по якорному слову ("айфон 13" -> "айфон бу", ...)
+    if len(items) < limit:
+        for h in ai_hints(normalize_query_advanced(query), [], limit):
+            if h in seen:
+                continue
+            seen.add(h)
+            items.append({"query": h, "normalized_query": h, "popularity": 0, "results_count": 0})
+            if len(items) >= limit:
+                break
 
-    return {"suggestions": items}
+    return {
+        "query": query,
+        "normalized": nq,
+        "items": items,
+    }
 
 class TrainingSample(BaseModel):
     query: str
@@ -1776,6 +1434,47 @@ class TrainingSample(BaseModel):
     popularity: int
     created_at: datetime
 
+def _training_query(
+    db: Session,
+    from_date: Optional[datetime],
+    to_date: Optional[datetime],
+    min_popularity: int,
+    only_with_category: bool,
+):
+    """
+    Строки датасета: search_queries + slug/name категории одним JOIN-ом (без N+1).
+    """
+    q = (
+        db.query(
+            SearchQuery.id,
+            SearchQuery.query,
+            SearchQuery.normalized_query,
+            SearchQuery.category_id,
+            Category.slug.label("category_slug"),
+            Category.name.label("category_name"),
+            SearchQuery.results_count,
+            SearchQuery.popularity,
+            SearchQuery.source,
+            SearchQuery.created_at,
+        )
+        .outerjoin(Category, Category.id == SearchQuery.category_id)
+    )
+
+    if from_date is not None:
+        q = q.filter(SearchQuery.created_at >= from_date)
+
+    if to_date is not None:
+        q = q.filter(SearchQuery.created_at <= to_date)
+
+    if min_popularity > 0:
+        q = q.filter(SearchQuery.popularity >= min_popularity)
+
+    if only_with_category:
+        q = q.filter(SearchQuery.category_id.isnot(None))
+
+    return q
+
+
 @router.get(
     "/training-dataset",
     response_model=List[TrainingSampleOut],
@@ -1797,41 +1496,103 @@ def training_dataset(
     - min_popularity — минимальная популярность запроса
     - only_with_category — брать только те запросы, у которых есть категория
     - limit / offset — пагинация
+
+    Для выгрузки всей таблицы — /search/training-dataset/export (поток, keyset).
     """
 
-    q = db.query(SearchQuery)
+    rows = (
+        _training_query(db, from_date, to_date, min_popularity, only_with_category)
+        .order_by(SearchQuery.created_at.desc())
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
 
-    if from_date is not None:
-        q = q.filter(SearchQuery.created_at >= from_date)
+    return [TrainingSampleOut.model_validate(r, from_attributes=True) for r in rows]
 
-    if to_date is not None:
-        q = q.filter(SearchQuery.created_at <= to_date)
 
-    if min_popularity > 0:
-        q = q.filter(SearchQuery.popularity >= min_popularity)
+# сколько строк тянем из серверного курсора за раз
+TRAINING_YIELD_PER = 2000
 
-    if only_with_category:
-        q = q.filter(SearchQuery.category_id.isnot(None))
+TRAINING_FIELDS = (
+    "id", "query", "normalized_query", "category_id", "category_slug", "category_name",
+    "results_count", "popularity", "source", "created_at", "cursor",
+)
 
-    rows = (
-        q.order_by(SearchQuery.created_at.desc())
-         .offset(offset)
-         .limit(limit)
-         .all()
-    )
 
-    return [
-        TrainingSampleOut(
-            id=r.id,
-            query=r.query,
-            normalized_query=r.normalized_query,
-            category_id=r.category_id,
-            category_slug=r.category.slug if r.category else None,
-            category_name=r.category.name if r.category else None,
-            results_count=r.results_count,
-            popularity=r.popularity,
-            source=r.source,
-            created_at=r.created_at,
+def _parse_training_cursor(cursor: Optional[str]) -> Optional[tuple]:
+    after = decode_cursor(cursor, 2)
+    if after is None or after[0] is None:
+        return after
+    try:
+        return datetime.fromisoformat(after[0]), after[1]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _iter_training_rows(
+    after: Optional[tuple],
+    limit: Optional[int],
+    from_date: Optional[datetime],
+    to_date: Optional[datetime],
+    min_popularity: int,
+    only_with_category: bool,
+):
+    """
+    Строки датасета по возрастанию (created_at, id) поверх серверного курсора.
+    У каждой строки — cursor на неё саму: оборванную выгрузку можно продолжить
+    с последней полученной строки. Сессия своя — get_db закроется раньше,
+    чем StreamingResponse начнёт читать генератор.
+    """
+    db = SessionLocal()
+    try:
+        q = _training_query(db, from_date, to_date, min_popularity, only_with_category)
+        if after is not None:
+            q = q.filter(keyset_after(SearchQuery.created_at, SearchQuery.id, after[0], after[1]))
+        q = q.order_by(*keyset_order(SearchQuery.created_at, SearchQuery.id))
+        if limit is not None:
+            q = q.limit(limit)
+
+        for r in q.yield_per(TRAINING_YIELD_PER):
+            yield (*r, encode_cursor(r.created_at.isoformat() if r.created_at else None, r.id))
+    finally:
+        db.close()
+
+
+def _iter_training_ndjson(rows):
+    for r in rows:
+        item = dict(zip(TRAINING_FIELDS, r))
+        if item["created_at"] is not None:
+            item["created_at"] = item["created_at"].isoformat()
+        yield (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+@router.get("/training-dataset/export")
+def export_training_dataset(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    cursor: Optional[str] = Query(None, description="cursor последней полученной строки — продолжить выгрузку"),
+    limit: Optional[int] = Query(None, ge=1, description="максимум строк; по умолчанию — до конца"),
+    from_date: Optional[datetime] = Query(None),
+    to_date: Optional[datetime] = Query(None),
+    min_popularity: int = 0,
+    only_with_category: bool = False,
+):
+    """
+    Потоковая выгрузка датасета: NDJSON или CSV в gzip.
+
+    Строки идут по возрастанию (created_at, id) keyset-ом, без OFFSET,
+    память не растёт с размером таблицы. У каждой строки есть поле cursor:
+    передайте его в ?cursor=, чтобы продолжить выгрузку после обрыва
+    или читать таблицу порциями через limit.
+    """
+    after = _parse_training_cursor(cursor)
+    rows = _iter_training_rows(after, limit, from_date, to_date, min_popularity, only_with_category)
+
+    if format == "csv":
+        return StreamingResponse(
+            iter_gzip(iter_csv(rows, chunk_rows=TRAINING_YIELD_PER, fields=TRAINING_FIELDS)),
+            media_type="application/gzip",
+            headers={"Content-Disposition": 'attachment; filename="training_dataset.csv.gz"'},
         )
-        for r in rows
-        ]
+
+    return StreamingResponse(_iter_training_ndjson(rows), media_type="application/x-ndjson")
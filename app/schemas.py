@@ -126,29 +126,15 @@ class OlxProjectOut(OlxProjectBase):
 
     
 from typing import List, Optional
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, Field, HttpUrl
 
 # --- OLX Reports --- #
 class OlxReportCreate(BaseModel):
     url: HttpUrl
     max_pages: int = 1
     note: Optional[str] = None
-
-
-class OlxReportItemOut(BaseModel):
-    external_id: Optional[str] = None
-    title: Optional[str] = None
-    url: Optional[str] = None
-    price: Optional[float] = None
-    currency: Optional[str] = "UAH"
-    seller_id: Optional[str] = None
-    seller_name: Optional[str] = None
-    location: Optional[str] = None
-    position: Optional[int] = None
-    page: Optional[int] = None
-
-    class Config:
-        orm_mode = True
+    # секунды: если есть done-отчёт по тому же URL/страницам/note не старше max_age — вернём его без парсинга
+    max_age: Optional[int] = Field(None, ge=0)
 
 
 class OlxReportOut(BaseModel):
@@ -168,12 +154,19 @@ class OlxReportOut(BaseModel):
         orm_mode = True
 
 
-class OlxReportWithItemsOut(OlxReportOut):
-    items: List[OlxReportItemOut] = []
+class OlxReportItemsPageOut(BaseModel):
+    report_id: int
+    sort: str
+    limit: int
+    fields: List[str]
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
 
 
 class OlxReportListOut(BaseModel):
-    total: int
+    total: Optional[int] = None
+    total_capped: bool = False  # True -> реальных строк больше, чем total
+    next_after_id: Optional[int] = None
     items: List[OlxReportOut]
 
 class OlxMarketDeltaOut(BaseModel):
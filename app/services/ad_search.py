@@ -0,0 +1,205 @@
+# app/services/ad_search.py
+
+"""
+Полнотекстовый поиск по olx_ads для POST /search.
+
+Postgres: генерируемая колонка olx_ads.search_tsv (GIN-индекс ix_olx_ads_search_tsv):
+    title    -> вес A, конфиги simple + russian
+    category -> вес B, конфиги simple + russian
+  'simple' даёт точные словоформы (в т.ч. украинские — отдельного ukrainian-конфига
+  в стандартном Postgres нет), 'russian' — стемминг ("квартиры" ~ "квартира").
+  Фильтр по бренду = термы с весом A, по категории = с весом B.
+
+SQLite (dev): внешняя FTS5-таблица olx_ads_fts(title, category) на триггерах,
+  фильтр по колонкам + сортировка по bm25.
+
+Если индекса ещё нет (миграция не прошла) — старый ILIKE, чтобы поиск не падал.
+"""
+
+from functools import reduce
+from typing import List, Optional
+
+from sqlalchemy import column, func, inspect, literal_column, or_, select, table, text
+from sqlalchemy.orm import Query as OrmQuery, Session
+
+from app.models import OlxAd, OlxAdSnapshot
+from app.services.normalize import normalize_text
+
+MAX_TERMS = 8
+
+# bm25: совпадение в title весит больше, чем в category
+FTS5_WEIGHTS = (10.0, 2.0)
+
+PG_TSV_EXPR = (
+    "setweight(to_tsvector('simple'::regconfig, coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('russian'::regconfig, coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple'::regconfig, coalesce(category, '')), 'B') || "
+    "setweight(to_tsvector('russian'::regconfig, coalesce(category, '')), 'B')"
+)
+
+SQLITE_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS olx_ads_fts USING fts5("
+    "title, category, content='olx_ads', content_rowid='id');",
+    "CREATE TRIGGER IF NOT EXISTS olx_ads_fts_ai AFTER INSERT ON olx_ads BEGIN "
+    "INSERT INTO olx_ads_fts(rowid, title, category) VALUES (new.id, new.title, new.category); END;",
+    "CREATE TRIGGER IF NOT EXISTS olx_ads_fts_ad AFTER DELETE ON olx_ads BEGIN "
+    "INSERT INTO olx_ads_fts(olx_ads_fts, rowid, title, category) "
+    "VALUES ('delete', old.id, old.title, old.category); END;",
+    "CREATE TRIGGER IF NOT EXISTS olx_ads_fts_au AFTER UPDATE OF title, category ON olx_ads BEGIN "
+    "INSERT INTO olx_ads_fts(olx_ads_fts, rowid, title, category) "
+    "VALUES ('delete', old.id, old.title, old.category); "
+    "INSERT INTO olx_ads_fts(rowid, title, category) VALUES (new.id, new.title, new.category); END;",
+)
+
+_FTS = table("olx_ads_fts", column("rowid"))
+
+_fts_available: Optional[bool] = None
+
+
+def fts_tokens(s: Optional[str]) -> List[str]:
+    """
+    Токены для tsquery / FTS5 MATCH: после normalize_text в них только буквы и цифры,
+    так что экранировать операторы не нужно.
+    """
+    return normalize_text(s).split()[:MAX_TERMS]
+
+
+def fts_available(db: Session) -> bool:
+    global _fts_available
+    if _fts_available is None:
+        bind = db.get_bind()
+        if bind.dialect.name == "postgresql":
+            cols = {c["name"] for c in inspect(bind).get_columns("olx_ads")}
+            _fts_available = "search_tsv" in cols
+        elif bind.dialect.name == "sqlite":
+            _fts_available = db.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'olx_ads_fts'")
+            ).first() is not None
+        else:
+            _fts_available = False
+    return _fts_available
+
+
+# ===== Postgres =====
+
+def _pg_term(tok: str, weight: str = ""):
+    # префикс + вес: 'айфон:*A'; simple — словоформа, russian — стем
+    q = f"{tok}:*{weight}"
+    return func.to_tsquery(literal_column("'simple'::regconfig"), q).op("||")(
+        func.to_tsquery(literal_column("'russian'::regconfig"), q)
+    )
+
+
+def _pg_all(terms: list):
+    return reduce(lambda a, b: a.op("&&")(b), terms)
+
+
+def _pg_any(terms: list):
+    return reduce(lambda a, b: a.op("||")(b), terms)
+
+
+def _pg_search(q: OrmQuery, query_tokens, title_tokens, category_tokens) -> OrmQuery:
+    tsv = literal_column("olx_ads.search_tsv")
+
+    must = [_pg_term(t, "A") for t in title_tokens]
+    must += [_pg_term(t, "B") for t in category_tokens]
+    if not must:
+        must = [_pg_term(t) for t in query_tokens]
+    match = _pg_all(must)
+
+    # ранжируем по всему запросу: "iphone 13" внутри бренда apple выше, чем просто "iphone"
+    rank_q = match.op("||")(_pg_any([_pg_term(t) for t in query_tokens])) if query_tokens else match
+
+    return (
+        q.filter(tsv.op("@@")(match))
+        .order_by(func.ts_rank(tsv, rank_q).desc(), OlxAd.id.desc())
+    )
+
+
+# ===== SQLite FTS5 =====
+
+def _fts5_group(column: Optional[str], tokens: List[str]) -> str:
+    terms = " AND ".join(f'"{t}"*' for t in tokens)
+    return f"{{{column}}} : ({terms})" if column else f"({terms})"
+
+
+def _sqlite_search(q: OrmQuery, query_tokens, title_tokens, category_tokens) -> OrmQuery:
+    parts = []
+    if title_tokens:
+        parts.append(_fts5_group("title", title_tokens))
+    if category_tokens:
+        parts.append(_fts5_group("category", category_tokens))
+    if not parts:
+        parts.append(_fts5_group(None, query_tokens))
+
+    fts = literal_column("olx_ads_fts")
+    return (
+        q.join(_FTS, _FTS.c.rowid == OlxAd.id)
+        .filter(fts.op("MATCH")(" AND ".join(parts)))
+        .order_by(func.bm25(fts, *FTS5_WEIGHTS), OlxAd.id.desc())
+    )
+
+
+# ===== API =====
+
+def _latest_snapshot(col):
+    return (
+        select(col)
+        .where(OlxAdSnapshot.ad_id == OlxAd.id)
+        .order_by(OlxAdSnapshot.collected_at.desc(), OlxAdSnapshot.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def search_item_columns() -> list:
+    """
+    Узкая проекция для выдачи /search: только то, что показывает фронт,
+    + текущая цена из последнего снапшота (подзапрос только для строк страницы).
+    """
+    return [
+        OlxAd.external_id,
+        OlxAd.title,
+        OlxAd.url,
+        OlxAd.location,
+        OlxAd.category,
+        _latest_snapshot(OlxAdSnapshot.price).label("price"),
+        _latest_snapshot(OlxAdSnapshot.currency).label("currency"),
+    ]
+
+
+def search_ads(
+    db: Session,
+    *,
+    query: str,
+    brand: Optional[str] = None,
+    category_name: Optional[str] = None,
+) -> OrmQuery:
+    """
+    Query по OlxAd, отфильтрованный и отсортированный по релевантности.
+
+    - бренд определён    -> все его токены должны быть в title;
+    - категория определена -> все токены её названия должны быть в category;
+    - ни того, ни другого -> все токены запроса в title/category.
+    """
+    q = db.query(OlxAd)
+
+    query_tokens = fts_tokens(query)
+    title_tokens = fts_tokens(brand)
+    category_tokens = fts_tokens(category_name)
+    if not (query_tokens or title_tokens or category_tokens):
+        return q
+
+    if not fts_available(db):
+        if category_name:
+            q = q.filter(OlxAd.category.ilike(f"%{category_name}%"))
+        if brand:
+            q = q.filter(OlxAd.title.ilike(f"%{brand}%"))
+        if not (category_name or brand):
+            for t in query_tokens:
+                q = q.filter(or_(OlxAd.title.ilike(f"%{t}%"), OlxAd.category.ilike(f"%{t}%")))
+        return q
+
+    if db.get_bind().dialect.name == "postgresql":
+        return _pg_search(q, query_tokens, title_tokens, category_tokens)
+    return _sqlite_search(q, query_tokens, title_tokens, category_tokens)
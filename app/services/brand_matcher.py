@@ -0,0 +1,141 @@
+# app/services/brand_matcher.py
+
+"""
+Скомпилированный матчер брендов (Aho-Corasick) для extract_brand.
+
+Все варианты написания из словаря синонимов нормализуются один раз
+и собираются в автомат; запрос проходится за один проход по строке,
+а не "бренды x варианты x normalize" на каждый вызов.
+
+Уровни score те же, что в исходном цикле:
+- 1.0  — фраза с пробелом ("new balance"), совпала по границам слов;
+- 0.95 — вариант совпал с целым токеном запроса;
+- 0.75 — вариант встретился как подстрока ("iphone11", "ps5pro").
+При равном score побеждает бренд, который раньше в словаре.
+"""
+
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+PHRASE_SCORE = 1.0
+TOKEN_SCORE = 0.95
+SUBSTRING_SCORE = 0.75
+
+
+class AhoCorasick:
+    def __init__(self, patterns: Iterable[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[List[int]] = [[]]
+        self.patterns: List[str] = []
+
+        for pid, p in enumerate(patterns):
+            self.patterns.append(p)
+            node = 0
+            for ch in p:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = nxt
+            self.out[node].append(pid)
+
+        # BFS: fail-ссылки + наследование выходов
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """
+        (индекс последнего символа вхождения, номер паттерна) для всех вхождений.
+        """
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for pid in out[node]:
+                yield i, pid
+
+
+class BrandMatcher:
+    def __init__(
+        self,
+        synonyms: Dict[str, List[str]],
+        normalize: Callable[[str], str],
+        tokenize: Callable[[str], List[str]],
+    ):
+        self.normalize = normalize
+        self.tokenize = tokenize
+        self.brands: List[str] = list(synonyms.keys())
+
+        # вариант -> [(индекс бренда, это фраза?)]
+        meta: Dict[str, List[Tuple[int, bool]]] = {}
+        for b_idx, (brand, variants) in enumerate(synonyms.items()):
+            for v in variants:
+                v_norm = normalize(v)
+                if not v_norm:
+                    continue
+                meta.setdefault(v_norm, []).append((b_idx, " " in v_norm))
+
+        self.automaton = AhoCorasick(meta.keys())
+        self.meta: List[List[Tuple[int, bool]]] = [meta[p] for p in self.automaton.patterns]
+
+    def match_normalized(self, qn: str, toks: List[str]) -> Tuple[Optional[str], float]:
+        if not toks:
+            return None, 0.0
+
+        tokset = set(toks)
+        last = len(qn) - 1
+        scores: Dict[int, float] = {}
+
+        for end, pid in self.automaton.iter_matches(qn):
+            v = self.automaton.patterns[pid]
+            start = end - len(v) + 1
+            for b_idx, is_phrase in self.meta[pid]:
+                if is_phrase:
+                    # фразу считаем только по границам слов
+                    if (start > 0 and qn[start - 1] != " ") or (end < last and qn[end + 1] != " "):
+                        continue
+                    score = PHRASE_SCORE
+                elif v in tokset:
+                    score = TOKEN_SCORE
+                else:
+                    score = SUBSTRING_SCORE
+                if score > scores.get(b_idx, 0.0):
+                    scores[b_idx] = score
+
+        if not scores:
+            return None, 0.0
+
+        best_idx = min(scores, key=lambda i: (-scores[i], i))
+        return self.brands[best_idx], scores[best_idx]
+
+    def match(self, query: str) -> Tuple[Optional[str], float]:
+        qn = self.normalize(query)
+        return self.match_normalized(qn, self.tokenize(qn))
+
+    def match_many(self, queries: Iterable[str]) -> List[Tuple[Optional[str], float]]:
+        """
+        Батч для бэкфиллов: каждая уникальная строка матчится один раз,
+        порядок и длина сохраняются.
+        """
+        found: Dict[str, Tuple[Optional[str], float]] = {}
+        out: List[Tuple[Optional[str], float]] = []
+        for q in queries:
+            r = found.get(q)
+            if r is None:
+                r = found[q] = self.match(q)
+            out.append(r)
+        return out
@@ -0,0 +1,164 @@
+# app/services/category_index.py
+
+"""
+In-memory индекс категорий для detect_category_from_query.
+
+Вместо OR из четырёх lower()/ILIKE по таблице categories на каждый запрос:
+- exact: хеш-таблица slug / name -> id категории;
+- substring: триграммный инвертированный индекс по терминам (name / name_ru / aliases),
+  кандидаты потом проверяются честным `q in term`.
+
+Приоритет как в SQL-версии: из всех подходящих категорий берём с минимальным id.
+Индекс перестраивается лениво: после изменения Category (ORM-события)
+и не реже раза в REBUILD_INTERVAL секунд (изменения из других процессов).
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models import Category
+
+REBUILD_INTERVAL = 300  # секунд
+NGRAM = 3
+
+
+@dataclass(frozen=True)
+class CachedCategory:
+    """
+    Снимок Category без привязки к сессии (те же имена полей, что у модели).
+    """
+    id: int
+    slug: Optional[str]
+    name: Optional[str]
+    name_ru: Optional[str]
+    keywords: Optional[str]
+    parent_id: Optional[int]
+
+    def all_aliases(self) -> List[str]:
+        if not self.keywords:
+            return []
+        return [a.strip().lower() for a in self.keywords.split(",") if a.strip()]
+
+
+def _ngrams(s: str) -> Set[str]:
+    return {s[i:i + NGRAM] for i in range(len(s) - NGRAM + 1)}
+
+
+class CategoryIndex:
+    def __init__(self, categories: List[CachedCategory]):
+        self.by_id: Dict[int, CachedCategory] = {c.id: c for c in categories}
+
+        # exact: точное совпадение со slug / name (как в SQL-версии)
+        self.exact: Dict[str, int] = {}
+        # substring: термины, в которых ищем вхождение запроса
+        self.terms: List[tuple] = []  # (term, category_id)
+        self.grams: Dict[str, Set[int]] = {}  # триграмма -> номера terms
+
+        for c in sorted(categories, key=lambda x: x.id):
+            for val in (c.slug, c.name):
+                if val:
+                    self.exact.setdefault(val.lower(), c.id)
+
+            for val in [c.name, c.name_ru, *c.all_aliases()]:
+                if not val:
+                    continue
+                term = val.lower()
+                n = len(self.terms)
+                self.terms.append((term, c.id))
+                for g in _ngrams(term):
+                    self.grams.setdefault(g, set()).add(n)
+
+        self.lookup = lru_cache(maxsize=4096)(self._lookup)
+
+    def _candidates(self, q: str):
+        if len(q) < NGRAM:
+            # 1-2 символа: триграмм нет, терминов немного — проходим все
+            return range(len(self.terms))
+
+        # пересечение постингов триграмм запроса, начиная с самого короткого
+        postings = sorted(
+            (self.grams.get(g, set()) for g in _ngrams(q)),
+            key=len,
+        )
+        candidates = set(postings[0]) if postings else set()
+        for p in postings[1:]:
+            if not candidates:
+                break
+            candidates &= p
+        return candidates
+
+    def _lookup(self, q: str) -> Optional[int]:
+        best = self.exact.get(q)
+
+        for n in self._candidates(q):
+            term, cat_id = self.terms[n]
+            if (best is None or cat_id < best) and q in term:
+                best = cat_id
+
+        return best
+
+    def match(self, q: str) -> Optional[CachedCategory]:
+        cat_id = self.lookup(q)
+        return self.by_id.get(cat_id) if cat_id is not None else None
+
+    def search(self, q: str, limit: int) -> List[CachedCategory]:
+        """
+        Все категории, у которых q входит в name / name_ru / keywords,
+        по алфавиту name (замена ILIKE '%q%' ... ORDER BY name).
+        """
+        ids = {
+            cat_id
+            for term, cat_id in (self.terms[n] for n in self._candidates(q))
+            if q in term
+        }
+        found = sorted((self.by_id[i] for i in ids), key=lambda c: c.name or "")
+        return found[:limit]
+
+
+_index: Optional[CategoryIndex] = None
+_built_at = 0.0
+_dirty = True
+_lock = threading.Lock()
+
+
+def invalidate_category_index() -> None:
+    """
+    Пометить индекс устаревшим — перестроится при следующем обращении.
+    """
+    global _dirty
+    _dirty = True
+
+
+def get_category_index(db: Session) -> CategoryIndex:
+    global _index, _built_at, _dirty
+
+    if _index is not None and not _dirty and time.monotonic() - _built_at < REBUILD_INTERVAL:
+        return _index
+
+    with _lock:
+        if _index is None or _dirty or time.monotonic() - _built_at >= REBUILD_INTERVAL:
+            _dirty = False
+            rows = db.query(
+                Category.id,
+                Category.slug,
+                Category.name,
+                Category.name_ru,
+                Category.keywords,
+                Category.parent_id,
+            ).all()
+            _index = CategoryIndex([CachedCategory(*r) for r in rows])
+            _built_at = time.monotonic()
+    return _index
+
+
+@event.listens_for(Category, "after_insert")
+@event.listens_for(Category, "after_update")
+@event.listens_for(Category, "after_delete")
+def _on_category_change(mapper, connection, target):
+    invalidate_category_index()
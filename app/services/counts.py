@@ -0,0 +1,47 @@
+import json
+from typing import Optional
+
+from sqlalchemy import func, literal, select
+from sqlalchemy.orm import Query as OrmQuery
+
+
+def capped_count(query: OrmQuery, cap: int) -> tuple[int, bool]:
+    """
+    Считаем строки, но не больше cap + 1.
+    Возвращает (count, capped): capped=True значит "cap+" — реально строк больше.
+    Стоимость ограничена cap строками, а не размером таблицы.
+    """
+    # maintain_column_froms: без фильтров у запроса иначе пропал бы FROM
+    sub = (
+        query.order_by(None)
+        .statement.with_only_columns(literal(1).label("one"), maintain_column_froms=True)
+        .limit(cap + 1)
+        .subquery()
+    )
+    n = query.session.execute(select(func.count()).select_from(sub)).scalar() or 0
+    if n > cap:
+        return cap, True
+    return n, False
+
+
+def estimated_count(query: OrmQuery) -> Optional[int]:
+    """
+    Оценка числа строк из планировщика Postgres (EXPLAIN, без выполнения запроса).
+    Точность — как у статистики ANALYZE. На других БД возвращает None.
+    """
+    session = query.session
+    bind = session.get_bind()
+    if bind.dialect.name != "postgresql":
+        return None
+
+    compiled = query.order_by(None).statement.compile(
+        dialect=bind.dialect,
+        compile_kwargs={"render_postcompile": True},
+    )
+    row = session.connection().exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+    ).first()
+    plan = row[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
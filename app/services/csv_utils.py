@@ -1,16 +1,53 @@
 import csv
 import io
-from typing import List, Dict, Any
+import zlib
+from typing import Any, Iterable, Iterator, Sequence
 
 CSV_FIELDS = [
     "external_id", "title", "url", "price", "currency",
     "seller_id", "seller_name", "location", "position", "page"
 ]
 
-def rows_to_csv(rows: List[Dict[str, Any]]) -> bytes:
+
+def iter_csv(
+    rows: Iterable[Sequence[Any]],
+    chunk_rows: int = 1000,
+    fields: Sequence[str] = CSV_FIELDS,
+) -> Iterator[bytes]:
+    """
+    CSV отчёта потоком: строки — кортежи в порядке fields.
+    Отдаём BOM + заголовок, потом куски по chunk_rows строк,
+    буфер переиспользуем — память не растёт с размером отчёта.
+    """
     buf = io.StringIO()
-    writer = csv.DictWriter(buf, fieldnames=CSV_FIELDS, extrasaction="ignore")
-    writer.writeheader()
+    writer = csv.writer(buf)
+    writer.writerow(fields)
+    yield buf.getvalue().encode("utf-8-sig")  # с BOM для Excel
+    buf.seek(0)
+    buf.truncate(0)
+
+    n = 0
     for r in rows:
         writer.writerow(r)
-    return buf.getvalue().encode("utf-8-sig")  # с BOM для Excel
+        n += 1
+        if n >= chunk_rows:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate(0)
+            n = 0
+
+    if n:
+        yield buf.getvalue().encode("utf-8")
+
+
+def iter_gzip(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """
+    Сжать поток байтов в gzip на лету (для StreamingResponse).
+    Пустые куски, которые иногда отдаёт компрессор, не шлём.
+    """
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = gzip-заголовок
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
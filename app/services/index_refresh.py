@@ -0,0 +1,52 @@
+# app/services/index_refresh.py
+
+"""
+Фоновая пересборка in-memory индексов (suggest_index, spell_index).
+
+    start_periodic_rebuild("suggest-index", lambda db: rebuild_suggest_index(db, hints), 600)
+
+- первая сборка — синхронно при старте приложения, до первого запроса;
+- дальше поток-демон раз в interval секунд собирает новый индекс на своей
+  сессии и подменяет ссылку в модуле индекса. Запросы только читают
+  готовую ссылку: ни БД, ни ожидания сборки на пути нажатия клавиши.
+- повторный вызов с тем же name ничего не делает (несколько include_router,
+  перезапуск startup в тестах).
+"""
+
+import threading
+import time
+from typing import Callable, Dict
+
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+
+_threads: Dict[str, threading.Thread] = {}
+_lock = threading.Lock()
+
+
+def _rebuild_once(name: str, rebuild: Callable[[Session], object]) -> None:
+    db = SessionLocal()
+    try:
+        rebuild(db)
+    except Exception as e:
+        # старый индекс остаётся в работе
+        print(f"{name} rebuild error:", e)
+    finally:
+        db.close()
+
+
+def start_periodic_rebuild(name: str, rebuild: Callable[[Session], object], interval: float) -> None:
+    with _lock:
+        if name in _threads:
+            return
+        _rebuild_once(name, rebuild)
+
+        def run():
+            while True:
+                time.sleep(interval)
+                _rebuild_once(name, rebuild)
+
+        thread = threading.Thread(target=run, name=f"{name}-refresh", daemon=True)
+        _threads[name] = thread
+        thread.start()
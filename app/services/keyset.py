@@ -0,0 +1,61 @@
+import base64
+import json
+from typing import Any, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    Упаковываем значения последней строки страницы в непрозрачный курсор.
+    """
+    raw = json.dumps(list(values), separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[Tuple[Any, ...]]:
+    """
+    Распаковываем курсор обратно в кортеж из size значений.
+    Битый курсор -> 400, а не 500.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return tuple(values)
+
+
+def keyset_order(col, id_col, desc: bool = False):
+    """
+    ORDER BY для пары (col, id): NULL всегда в конце, id — тай-брейкер.
+    """
+    if desc:
+        return [col.desc().nullslast(), id_col.desc()]
+    return [col.asc().nullslast(), id_col.asc()]
+
+
+def keyset_after(col, id_col, last_value: Any, last_id: Any, desc: bool = False):
+    """
+    WHERE "строго после (last_value, last_id)" в порядке keyset_order.
+    """
+    if last_value is None:
+        # мы уже в хвосте с NULL-ами — дальше только по id
+        return and_(col.is_(None), id_col < last_id if desc else id_col > last_id)
+
+    if desc:
+        return or_(
+            col < last_value,
+            and_(col == last_value, id_col < last_id),
+            col.is_(None),
+        )
+    return or_(
+        col > last_value,
+        and_(col == last_value, id_col > last_id),
+        col.is_(None),
+    )
@@ -0,0 +1,96 @@
+# app/services/normalize.py
+
+"""
+Единая нормализация поисковых запросов и текстов.
+
+Раньше было четыре версии (search.normalize_query, normalize_query_advanced,
+analytics._norm_text, scripts/seed_suggestions_from_ads.normalize_text)
+с чуть разными правилами. Теперь все роутеры и скрипты берут их отсюда.
+
+- normalize_query          — lower + схлопывание пробелов (то, что лежит в normalized_query);
+- normalize_text           — то же + вся пунктуация в пробел (для токенов/матчинга);
+- normalize_query_advanced — normalize_query + префиксный словарь ("айф" -> "айфон");
+- normalize_many           — батч для бэкфиллов: дедуп + один проход.
+
+Горячие запросы повторяются постоянно, поэтому результаты мемоизированы
+в ограниченном LRU (NORMALIZE_CACHE_SIZE строк на функцию).
+"""
+
+import re
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional
+
+NORMALIZE_CACHE_SIZE = 65536
+
+# всё, кроме цифр, латиницы, кириллицы (RU + UA) и пробелов
+_NON_WORD_RE = re.compile(r"[^0-9a-zа-яёіїєґ\s]+", re.IGNORECASE)
+
+# префикс -> каноническое слово (порядок важен: первый подходящий побеждает)
+PREFIX_CANON = (
+    ("айф", "айфон"),
+    ("iphone", "айфон"),
+    ("ifon", "айфон"),
+
+    ("смартф", "смартфон"),
+    ("тел", "телефон"),
+
+    ("ноут", "ноутбук"),
+    ("mac", "макбук"),
+    ("macbook", "макбук"),
+
+    ("квар", "квартира"),
+    ("оренда", "аренда"),
+    ("аренда", "аренда"),
+
+    ("авто", "авто"),
+)
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_query(q: Optional[str]) -> str:
+    """
+    Приводим запрос к нижнему регистру, убираем лишние пробелы.
+    """
+    return " ".join((q or "").lower().split())
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_text(s: Optional[str]) -> str:
+    """
+    normalize_query + пунктуация/символы -> пробел ("iPhone-13, б/у" -> "iphone 13 б у").
+    """
+    s = (s or "").lower()
+    return " ".join(_NON_WORD_RE.sub(" ", s).split())
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_query_advanced(q: Optional[str]) -> str:
+    """
+    normalize_query + словарь префиксов: "айф" -> "айфон", "ноут" -> "ноутбук" и т.д.
+    """
+    q = normalize_query(q)
+    for prefix, canon in PREFIX_CANON:
+        if q.startswith(prefix):
+            return canon
+    return q
+
+
+def normalize_many(
+    items: Iterable[Optional[str]],
+    normalizer: Callable[[Optional[str]], str] = normalize_query,
+) -> List[str]:
+    """
+    Батч-нормализация для аналитики и бэкфиллов.
+    Каждая уникальная строка нормализуется один раз, порядок и длина сохраняются.
+    Кэш LRU при этом не трогаем — батч не должен вытеснять горячие запросы.
+    """
+    fn = getattr(normalizer, "__wrapped__", normalizer)
+    seen: Dict[Optional[str], str] = {}
+    out: List[str] = []
+    for s in items:
+        n = seen.get(s)
+        if n is None:
+            n = fn(s)
+            seen[s] = n
+        out.append(n)
+    return out
@@ -0,0 +1,82 @@
+# app/services/popularity.py
+
+"""
+Затухающая популярность запросов: search_queries.popularity_score.
+
+Каждый поиск в момент t весит 2 ** ((t - SCORE_EPOCH) / half_life) — "forward decay":
+вес растёт со временем вместо того, чтобы старые веса уменьшались. Отсюда:
+
+- обновление O(1) и без чтения строки: popularity_score += weight(t)
+  (тот же INSERT ... ON CONFLICT, что и для popularity);
+- сравнение строк корректно в любой момент без пересчёта: у всех строк
+  общий множитель 2 ** (-(now - SCORE_EPOCH) / half_life), на порядок он не влияет,
+  поэтому ORDER BY popularity_score — это порядок по затухшей популярности
+  и обслуживается индексом (query_prefix, popularity_score DESC);
+- текущее значение "сколько поисков с учётом затухания" — current_score().
+
+Вес удваивается каждые half_life дней, float выдерживает ~1000 удвоений:
+с полураспадом 7 дней SCORE_EPOCH нужно сдвинуть (и поделить колонку на
+тот же множитель) лет через 19.
+"""
+
+import math
+from datetime import datetime
+from typing import Optional
+
+# Зашиты в коде, а не в env: все строки popularity_score должны быть в одних единицах.
+# Поменять любое из двух = пересчитать колонку целиком (миграция d9a4f1b7c305 — на те же значения).
+SCORE_HALF_LIFE_DAYS = 7.0
+SCORE_EPOCH = datetime(2026, 1, 1)
+
+# длина search_queries.query_prefix: подсказки по префиксу такой длины —
+# упорядоченный range scan по (query_prefix, popularity_score DESC)
+QUERY_PREFIX_LEN = 3
+
+_HALF_LIFE_SECONDS = SCORE_HALF_LIFE_DAYS * 86400.0
+
+
+def decay_weight(ts: Optional[datetime]) -> float:
+    """
+    Вес одного поиска в момент ts в единицах popularity_score.
+    """
+    ts = ts or datetime.utcnow()
+    return 2.0 ** ((ts - SCORE_EPOCH).total_seconds() / _HALF_LIFE_SECONDS)
+
+
+def current_score(stored: Optional[float], now: Optional[datetime] = None) -> float:
+    """
+    popularity_score -> затухшее число поисков на момент now (по умолчанию — сейчас).
+    """
+    if not stored:
+        return 0.0
+    return stored / decay_weight(now)
+
+
+def query_prefix(normalized_query: Optional[str]) -> str:
+    return (normalized_query or "")[:QUERY_PREFIX_LEN]
+
+
+def prefix_backfill_sql() -> str:
+    return (
+        "UPDATE search_queries "
+        f"SET query_prefix = SUBSTR(normalized_query, 1, {QUERY_PREFIX_LEN}) "
+        "WHERE query_prefix IS NULL"
+    )
+
+
+def score_backfill_sql(dialect: str) -> str:
+    """
+    UPDATE для строк без popularity_score: вся popularity считается
+    поисками в момент created_at (точнее история не сохранилась).
+    """
+    ln2_per_day = math.log(2.0) / SCORE_HALF_LIFE_DAYS
+    epoch = SCORE_EPOCH.strftime("%Y-%m-%d %H:%M:%S")
+    if dialect == "postgresql":
+        days = f"EXTRACT(EPOCH FROM (COALESCE(created_at, now()) - TIMESTAMP '{epoch}')) / 86400.0"
+    else:
+        days = f"(julianday(COALESCE(created_at, CURRENT_TIMESTAMP)) - julianday('{epoch}'))"
+    return (
+        "UPDATE search_queries "
+        f"SET popularity_score = COALESCE(popularity, 1) * EXP({ln2_per_day!r} * {days}) "
+        "WHERE popularity_score IS NULL"
+    )
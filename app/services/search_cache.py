@@ -0,0 +1,148 @@
+# app/services/search_cache.py
+
+"""
+Кэш страниц результатов POST /search (TTL + LRU) в памяти процесса.
+
+Ключ: (normalized_query, category_id, brand, page, режим count).
+Инвалидация — счётчик поколений: все записи прошлых поколений считаются промахом.
+generation растёт, когда меняется "версия данных" olx_ads —
+(max(id), max(last_seen_at)). Её читает sync_generation() не чаще раза
+в SEARCH_CACHE_PROBE_INTERVAL секунд (два index-only lookup-а), так что
+загрузку объявлений любым путём — парсер, другой процесс, SQL напрямую —
+кэш замечает через пару секунд, а не через TTL. Commit ORM-сессии, менявшей
+OlxAd в этом процессе, сбрасывает кэш сразу.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from app.models import OlxAd
+
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2048"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "60"))  # секунд
+SEARCH_CACHE_PROBE_INTERVAL = float(os.getenv("SEARCH_CACHE_PROBE_INTERVAL", "2"))  # секунд
+
+
+class SearchResultCache:
+    def __init__(
+        self,
+        maxsize: int = SEARCH_CACHE_SIZE,
+        ttl: float = SEARCH_CACHE_TTL,
+        probe_interval: float = SEARCH_CACHE_PROBE_INTERVAL,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.probe_interval = probe_interval
+        self.generation = 0
+        self._data_version: Optional[tuple] = None
+        self._probed_at = float("-inf")
+        self._probe_lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def sync_generation(self, db: Session) -> int:
+        """
+        Текущее поколение. Раз в probe_interval секунд один запрос сверяет версию
+        данных olx_ads с прошлой и при расхождении сбрасывает кэш; остальные
+        запросы в это время не ждут и берут generation как есть.
+        """
+        now = time.monotonic()
+        if now - self._probed_at >= self.probe_interval and self._probe_lock.acquire(blocking=False):
+            try:
+                self._probed_at = now
+                version = tuple(db.execute(select(func.max(OlxAd.id), func.max(OlxAd.last_seen_at))).one())
+                if self._data_version is not None and version != self._data_version:
+                    self.invalidate()
+                self._data_version = version
+            finally:
+                self._probe_lock.release()
+        return self.generation
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, generation, expires_at = item
+            if generation != self.generation or expires_at < now:
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, generation: int) -> None:
+        """
+        generation — поколение, прочитанное ДО запроса к БД: если за это время
+        пришли новые объявления, результат сразу устаревший и в кэш не попадёт.
+        """
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._data[key] = (value, generation, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            # старые записи не нужны — освобождаем память сразу
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "probe_interval": self.probe_interval,
+                "generation": self.generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+search_cache = SearchResultCache()
+
+
+# ===== инвалидация при записи OlxAd через ORM этого процесса =====
+# Сбрасываем после commit, а не во flush: иначе параллельный поиск успел бы
+# закэшировать ещё не закоммиченное состояние как свежее.
+
+@event.listens_for(Session, "after_flush")
+def _mark_ads_changed(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, OlxAd):
+            session.info["olx_ads_changed"] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    if session.info.pop("olx_ads_changed", False):
+        search_cache.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_on_rollback(session):
+    session.info.pop("olx_ads_changed", None)
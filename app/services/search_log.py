@@ -0,0 +1,464 @@
+# app/services/search_log.py
+
+"""
+Логирование поисковых запросов: append-only поток search_events + компактор.
+
+- SearchLogBuffer: write-behind буфер в памяти процесса. Запрос только
+  добавляет событие в список, а фоновый поток раз в SEARCH_LOG_FLUSH_MS
+  пишет всё накопленное одним пакетным INSERT в search_events — без
+  ON CONFLICT и без блокировок горячих строк агрегата.
+- compact_search_events(): забирает пачку несвёрнутых событий
+  (UPDATE ... SET compacted_at RETURNING, в Postgres с FOR UPDATE SKIP LOCKED —
+  компакторы разных процессов не пересекаются), сворачивает их в search_queries
+  (upsert_search_queries) и дневной rollup search_daily_agg по времени самого
+  события, всё в одной транзакции. Раз в SEARCH_COMPACT_INTERVAL его запускает
+  тот же фоновый поток, по крону — scripts/compact_search_events.py.
+- События не удаляются при компакции: это по-дневная и по-пользовательская
+  история — из неё пересобирается rollup (search_rollup.rebuild_daily_agg)
+  и считается /analytics с user_id.
+  purge_search_events() удаляет свёрнутые события старше
+  SEARCH_EVENTS_RETENTION_DAYS (раз в час из того же потока).
+- upsert_search_queries(): INSERT ... ON CONFLICT DO UPDATE
+  SET popularity = popularity + excluded.popularity для пачки ключей
+  (normalized_query, category_id), кусками по UPSERT_CHUNK_ROWS строк.
+"""
+
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, literal_column, select, update
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal, engine
+from app.models import Category, SearchEvent, SearchQuery
+from app.services.popularity import decay_weight, query_prefix
+from app.services.search_rollup import UPSERT_CHUNK_ROWS, upsert_daily_agg
+from app.services.suggest_index import note_search_query
+
+SEARCH_LOG_FLUSH_MS = int(os.getenv("SEARCH_LOG_FLUSH_MS", "500"))
+# секунд между компакциями в фоновом потоке; 0 — только scripts/compact_search_events.py
+SEARCH_COMPACT_INTERVAL = float(os.getenv("SEARCH_COMPACT_INTERVAL", "5"))
+# столько событий в буфере -> будим flusher, не дожидаясь таймера
+SEARCH_LOG_MAX_PENDING = 5000
+# событий за одну транзакцию компактора
+SEARCH_COMPACT_BATCH = 10_000
+# последняя свёрнутая popularity по ключу — для оценки в ответе /search без чтения БД
+KNOWN_POPULARITY_SIZE = 100_000
+# сколько дней храним свёрнутые события; 0 — не удалять
+SEARCH_EVENTS_RETENTION_DAYS = int(os.getenv("SEARCH_EVENTS_RETENTION_DAYS", "400"))
+PURGE_INTERVAL = 3600  # секунд
+PURGE_BATCH = 10_000
+
+if engine.dialect.name == "postgresql":
+    from sqlalchemy.dialects.postgresql import insert as _insert
+else:
+    from sqlalchemy.dialects.sqlite import insert as _insert
+
+
+_SQ_FIELDS = (
+    "query", "normalized_query", "category_id", "popularity", "results_count",
+    "source", "user_id", "created_at", "brand", "brand_score", "model", "popularity_score",
+)
+
+
+def upsert_search_queries(db: Session, rows: List[dict]):
+    """
+    rows: dict-ы с query, normalized_query, category_id, popularity и
+    popularity_score (приросты), results_count, source, user_id, brand, brand_score, model.
+    Ключи в пачке должны быть уникальны. Пишется кусками по UPSERT_CHUNK_ROWS строк
+    (лимит bind-параметров Postgres).
+    Возвращает обновлённые/вставленные строки (RETURNING).
+    """
+    out = []
+    for i in range(0, len(rows), UPSERT_CHUNK_ROWS):
+        out.extend(_upsert_search_queries_chunk(db, rows[i:i + UPSERT_CHUNK_ROWS]))
+    return out
+
+
+def _upsert_search_queries_chunk(db: Session, rows: List[dict]):
+    stmt = _insert(SearchQuery).values([
+        {**{k: r[k] for k in _SQ_FIELDS}, "query_prefix": query_prefix(r["normalized_query"])}
+        for r in rows
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            SearchQuery.normalized_query,
+            # литерал, а не bind-параметр: иначе БД не сопоставит выражение с индексом
+            func.coalesce(SearchQuery.category_id, literal_column("0")),
+        ],
+        set_={
+            "popularity": SearchQuery.popularity + stmt.excluded.popularity,
+            # O(1): прибавляем вес поисков, старые не пересчитываем (forward decay)
+            "popularity_score": func.coalesce(SearchQuery.popularity_score, 0) + stmt.excluded.popularity_score,
+            "results_count": stmt.excluded.results_count,
+            "source": stmt.excluded.source,
+            "query": stmt.excluded.query,
+            "user_id": func.coalesce(stmt.excluded.user_id, SearchQuery.user_id),
+            "brand": stmt.excluded.brand,
+            "brand_score": stmt.excluded.brand_score,
+            "model": stmt.excluded.model,
+        },
+    ).returning(
+        SearchQuery.id,
+        SearchQuery.query,
+        SearchQuery.normalized_query,
+        SearchQuery.category_id,
+        SearchQuery.results_count,
+        SearchQuery.popularity,
+        SearchQuery.popularity_score,
+        SearchQuery.source,
+        SearchQuery.created_at,
+    )
+    return db.execute(stmt).all()
+
+
+# ===== поток событий =====
+
+Key = Tuple[str, Optional[int]]
+
+
+class CompactResult(NamedTuple):
+    events: int
+    # строки search_queries из RETURNING
+    rows: list
+    # ключ -> сколько поисков этой пачки в него свёрнуто
+    folded: Dict[Key, int]
+    # category_id -> slug для строк rows
+    slugs: Dict[int, str]
+
+def append_search_events(db: Session, events: List[dict]) -> None:
+    """
+    events: dict-ы с ts, query, normalized_query, category_id, results_count,
+    source, user_id, brand, brand_score, model. Один пакетный INSERT
+    (executemany). Коммит — на вызывающем.
+    """
+    if events:
+        db.execute(insert(SearchEvent), events)
+
+
+def fold_search_events(events) -> Tuple[List[dict], List[dict]]:
+    """
+    Свернуть события (по возрастанию id) в приросты для search_queries
+    и search_daily_agg. Последние значения побеждают, как при UPDATE.
+    """
+    queries: Dict[Tuple[str, Optional[int]], dict] = {}
+    daily: Dict[tuple, dict] = {}
+
+    for e in events:
+        key = (e.normalized_query, e.category_id)
+        row = queries.get(key)
+        if row is None:
+            row = queries[key] = {
+                "normalized_query": e.normalized_query,
+                "category_id": e.category_id,
+                "popularity": 0,
+                "popularity_score": 0.0,
+                "user_id": None,
+                # для новой строки created_at = первый поиск; у существующей не меняется
+                "created_at": e.ts,
+            }
+        row["popularity"] += 1
+        row["popularity_score"] += decay_weight(e.ts)
+        row["query"] = e.query
+        row["results_count"] = e.results_count
+        row["source"] = e.source
+        row["brand"] = e.brand
+        row["brand_score"] = e.brand_score
+        row["model"] = e.model
+        if e.user_id is not None:
+            row["user_id"] = e.user_id
+
+        day_key = (e.ts.date(), e.normalized_query, e.category_id)
+        agg = daily.get(day_key)
+        if agg is None:
+            agg = daily[day_key] = {
+                "day": day_key[0],
+                "normalized_query": e.normalized_query,
+                "category_id": e.category_id,
+                "searches": 0,
+                "popularity": 0,
+                "results": 0,
+            }
+        agg["searches"] += 1
+        agg["popularity"] += 1
+        agg["results"] += e.results_count or 0
+        agg["brand"] = e.brand
+
+    return list(queries.values()), list(daily.values())
+
+
+def compact_search_events(db: Session, batch: int = SEARCH_COMPACT_BATCH):
+    """
+    Забрать до batch самых старых несвёрнутых событий и свернуть их
+    в search_queries и search_daily_agg. compacted_at ставится в той же
+    транзакции, что и upsert-ы, поэтому каждое событие учитывается ровно
+    один раз; при ошибке всё откатывается и события остаются в очереди.
+    Возвращает CompactResult: число событий, строки search_queries из RETURNING,
+    свёрнутые поиски по ключам и slug-и категорий этих строк.
+    """
+    claim = (
+        select(SearchEvent.id)
+        .where(SearchEvent.compacted_at.is_(None))
+        .order_by(SearchEvent.id)
+        .limit(batch)
+    )
+    if db.get_bind().dialect.name == "postgresql":
+        claim = claim.with_for_update(skip_locked=True)
+
+    stmt = (
+        update(SearchEvent)
+        .where(SearchEvent.id.in_(claim))
+        .values(compacted_at=datetime.utcnow())
+        .returning(
+            SearchEvent.id,
+            SearchEvent.ts,
+            SearchEvent.query,
+            SearchEvent.normalized_query,
+            SearchEvent.category_id,
+            SearchEvent.results_count,
+            SearchEvent.source,
+            SearchEvent.user_id,
+            SearchEvent.brand,
+            SearchEvent.brand_score,
+            SearchEvent.model,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    try:
+        # порядок строк RETURNING не гарантирован
+        events = sorted(db.execute(stmt).all(), key=lambda e: e.id)
+        if not events:
+            db.commit()
+            return CompactResult(0, [], {}, {})
+
+        result = _fold_and_upsert(db, events)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return result
+
+
+def purge_search_events(db: Session, retention_days: int = SEARCH_EVENTS_RETENTION_DAYS) -> int:
+    """
+    Удалить свёрнутые события старше retention_days дней (граница — начало суток,
+    чтобы оставшиеся дни были полными). Пачками по PURGE_BATCH, каждая — своя
+    транзакция. Возвращает число удалённых.
+    """
+    if retention_days <= 0:
+        return 0
+    cutoff = datetime.combine(datetime.utcnow().date() - timedelta(days=retention_days), datetime.min.time())
+
+    total = 0
+    while True:
+        victims = (
+            select(SearchEvent.id)
+            .where(SearchEvent.ts < cutoff, SearchEvent.compacted_at.is_not(None))
+            .limit(PURGE_BATCH)
+        )
+        n = db.execute(
+            delete(SearchEvent)
+            .where(SearchEvent.id.in_(victims))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        total += n
+        if n < PURGE_BATCH:
+            return total
+
+
+def log_search_event_now(db: Session, event: dict) -> CompactResult:
+    """
+    Свернуть одно событие сразу, без очереди: событие пишется в search_events
+    уже свёрнутым (compacted_at), upsert в search_queries и search_daily_agg —
+    в транзакции вызывающего (коммит — на нём).
+    Для POST /search/log, которому нужна итоговая строка (id, popularity).
+    """
+    append_search_events(db, [{**event, "compacted_at": datetime.utcnow()}])
+    return _fold_and_upsert(db, [SimpleNamespace(**event)])
+
+
+def _fold_and_upsert(db: Session, events) -> CompactResult:
+    queries, daily = fold_search_events(events)
+    rows = upsert_search_queries(db, queries)
+    upsert_daily_agg(db, daily)
+
+    folded = {(q["normalized_query"], q["category_id"]): q["popularity"] for q in queries}
+    category_ids = {r.category_id for r in rows if r.category_id is not None}
+    slugs: Dict[int, str] = {}
+    if category_ids:
+        slugs = dict(db.execute(select(Category.id, Category.slug).where(Category.id.in_(category_ids))).all())
+    return CompactResult(len(events), rows, folded, slugs)
+
+
+# ===== write-behind буфер =====
+
+class SearchLogBuffer:
+    def __init__(
+        self,
+        flush_ms: int = SEARCH_LOG_FLUSH_MS,
+        compact_interval: float = SEARCH_COMPACT_INTERVAL,
+    ):
+        self.flush_interval = flush_ms / 1000.0
+        self.compact_interval = compact_interval
+        self._pending: List[dict] = []
+        # поиски этого процесса, ещё не попавшие в свёрнутую popularity
+        self._unfolded: Dict[Key, int] = {}
+        self._known: "OrderedDict[Key, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(
+        self,
+        *,
+        query: str,
+        normalized_query: str,
+        category_id: Optional[int] = None,
+        results_count: int = 0,
+        source: str = "frontend",
+        user_id: Optional[int] = None,
+        brand: Optional[str] = None,
+        brand_score: float = 0.0,
+        model: Optional[str] = None,
+    ) -> int:
+        """
+        Учесть один поиск. Возвращает оценку popularity ключа:
+        последнее свёрнутое значение + поиски этого процесса после него.
+        """
+        key = (normalized_query, category_id)
+        event = {
+            "ts": datetime.utcnow(),
+            "query": query,
+            "normalized_query": normalized_query,
+            "category_id": category_id,
+            "results_count": results_count,
+            "source": source,
+            "user_id": user_id,
+            "brand": brand,
+            "brand_score": brand_score,
+            "model": model,
+        }
+        with self._lock:
+            self._pending.append(event)
+            unfolded = self._unfolded[key] = self._unfolded.get(key, 0) + 1
+            estimate = self._known.get(key, 0) + unfolded
+            size = len(self._pending)
+
+        self._ensure_thread()
+        if size >= SEARCH_LOG_MAX_PENDING:
+            self._wake.set()
+        return estimate
+
+    def estimate(self, normalized_query: str, category_id: Optional[int] = None) -> int:
+        key = (normalized_query, category_id)
+        with self._lock:
+            return self._known.get(key, 0) + self._unfolded.get(key, 0)
+
+    def flush(self) -> int:
+        """
+        Сбросить буфер в search_events одним пакетным INSERT. Возвращает число событий.
+        """
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+
+        db = SessionLocal()
+        try:
+            append_search_events(db, batch)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print("Search log flush error:", e)
+            # вернём в начало буфера, чтобы не потерять события
+            with self._lock:
+                self._pending[:0] = batch
+            return 0
+        finally:
+            db.close()
+        return len(batch)
+
+    def compact(self, batch: int = SEARCH_COMPACT_BATCH) -> int:
+        """
+        Свернуть всю очередь search_events пачками. Возвращает число событий.
+        """
+        total = 0
+        db = SessionLocal()
+        try:
+            while True:
+                result = compact_search_events(db, batch)
+                total += result.events
+                self.note_rows(result)
+                if result.events < batch:
+                    break
+        except Exception as e:
+            print("Search events compaction error:", e)
+        finally:
+            db.close()
+        return total
+
+    def purge(self) -> int:
+        db = SessionLocal()
+        try:
+            return purge_search_events(db)
+        except Exception as e:
+            db.rollback()
+            print("Search events purge error:", e)
+            return 0
+        finally:
+            db.close()
+
+    def note_rows(self, result: CompactResult) -> None:
+        with self._lock:
+            for r in result.rows:
+                key = (r.normalized_query, r.category_id)
+                self._known[key] = r.popularity
+                self._known.move_to_end(key)
+                # свёрнутое значение уже включает эти поиски; добавленные после
+                # сброса (и ещё не свёрнутые) должны остаться в оценке
+                left = self._unfolded.get(key, 0) - result.folded.get(key, 0)
+                if left > 0:
+                    self._unfolded[key] = left
+                else:
+                    self._unfolded.pop(key, None)
+            while len(self._known) > KNOWN_POPULARITY_SIZE:
+                self._known.popitem(last=False)
+            if len(self._unfolded) > KNOWN_POPULARITY_SIZE:
+                self._unfolded.clear()
+
+        # подсказки (trie) узнают о новых popularity без пересборки
+        for r in result.rows:
+            note_search_query(r, result.slugs.get(r.category_id))
+
+    def _run(self):
+        next_compact = time.monotonic() + self.compact_interval
+        next_purge = time.monotonic() + PURGE_INTERVAL
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+            if self.compact_interval > 0 and time.monotonic() >= next_compact:
+                self.compact()
+                next_compact = time.monotonic() + self.compact_interval
+                if time.monotonic() >= next_purge:
+                    self.purge()
+                    next_purge = time.monotonic() + PURGE_INTERVAL
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="search-log-flush", daemon=True)
+                self._thread.start()
+
+
+search_log_buffer = SearchLogBuffer()
+atexit.register(search_log_buffer.flush)
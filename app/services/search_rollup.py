@@ -0,0 +1,160 @@
+# app/services/search_rollup.py
+
+"""
+Дневной rollup поисков (таблица search_daily_agg) для трендовых эндпоинтов.
+
+- upsert_daily_agg()   — инкремент при компакции search_events (INSERT ... ON CONFLICT
+  кусками по UPSERT_CHUNK_ROWS строк);
+- rebuild_daily_agg()  — пересборка с дня X из search_events (scripts/rebuild_search_daily_agg.py);
+- seed_daily_agg_from_queries() — первое заполнение из search_queries (история до search_events);
+- period_start()       — свёртка дней в недели/месяцы на стороне Python:
+  date_trunc есть только в Postgres, а строк в rollup немного (запросы * дни).
+"""
+
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Union
+
+from sqlalchemy import delete, func, insert, literal_column, select
+from sqlalchemy.orm import Session
+
+from app.db import engine
+from app.models import SearchDailyAgg, SearchEvent, SearchQuery
+
+if engine.dialect.name == "postgresql":
+    from sqlalchemy.dialects.postgresql import insert as _insert
+else:
+    from sqlalchemy.dialects.sqlite import insert as _insert
+
+
+# строк в одном многострочном INSERT ... VALUES: Postgres принимает не больше 65535
+# bind-параметров на запрос, а у нас 7-13 колонок на строку — 1000 строк с запасом
+UPSERT_CHUNK_ROWS = 1000
+
+
+def upsert_daily_agg(db: Session, rows: List[dict]) -> None:
+    """
+    rows: dict-ы с day, normalized_query, category_id, brand, searches, popularity, results
+    (приросты). Ключи (day, normalized_query, category_id) в пачке должны быть уникальны.
+    Пишется кусками по UPSERT_CHUNK_ROWS строк.
+    Коммит — на вызывающем (в одной транзакции с search_queries).
+    """
+    for i in range(0, len(rows), UPSERT_CHUNK_ROWS):
+        _upsert_daily_agg_chunk(db, rows[i:i + UPSERT_CHUNK_ROWS])
+
+
+def _upsert_daily_agg_chunk(db: Session, rows: List[dict]) -> None:
+    stmt = _insert(SearchDailyAgg).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            SearchDailyAgg.day,
+            SearchDailyAgg.normalized_query,
+            func.coalesce(SearchDailyAgg.category_id, literal_column("0")),
+        ],
+        set_={
+            "searches": SearchDailyAgg.searches + stmt.excluded.searches,
+            "popularity": SearchDailyAgg.popularity + stmt.excluded.popularity,
+            "results": SearchDailyAgg.results + stmt.excluded.results,
+            "brand": stmt.excluded.brand,
+        },
+    )
+    db.execute(stmt)
+
+
+def rebuild_daily_agg(db: Session, since: Optional[date] = None) -> int:
+    """
+    Пересобрать rollup за дни [since, ...] из search_events — там по-дневная
+    история (одно событие = один поиск), в отличие от агрегата search_queries.
+
+    Берутся только свёрнутые события (compacted_at IS NOT NULL): несвёрнутые
+    компактор добавит в rollup сам. По умолчанию since — день после самого
+    раннего сохранённого события: первый день потока может быть неполным
+    (retention режет по суткам, но до перехода на хранение событий их удаляли).
+    Дни раньше since не трогаются. Запускать при остановленном компакторе
+    (SEARCH_COMPACT_INTERVAL=0), иначе пачка, свёрнутая во время пересборки,
+    может учесться дважды.
+    """
+    if since is None:
+        first = db.execute(select(func.min(SearchEvent.ts))).scalar()
+        if first is None:
+            return 0
+        since = as_date(first) + timedelta(days=1)
+    start = datetime.combine(since, datetime.min.time())
+    day = func.date(SearchEvent.ts)
+
+    src = (
+        select(
+            day,
+            SearchEvent.normalized_query,
+            SearchEvent.category_id,
+            func.max(SearchEvent.brand),
+            func.count(),
+            func.count(),
+            func.coalesce(func.sum(SearchEvent.results_count), 0),
+        )
+        .where(SearchEvent.ts >= start, SearchEvent.compacted_at.is_not(None))
+        .group_by(day, SearchEvent.normalized_query, SearchEvent.category_id)
+    )
+
+    db.execute(delete(SearchDailyAgg).where(SearchDailyAgg.day >= since))
+    result = db.execute(
+        insert(SearchDailyAgg).from_select(
+            ["day", "normalized_query", "category_id", "brand", "searches", "popularity", "results"],
+            src,
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+def seed_daily_agg_from_queries(db: Session) -> int:
+    """
+    Первое заполнение пустого rollup из search_queries — для истории, которой
+    нет в search_events. search_queries — агрегат по ключу, поэтому вся popularity
+    строки (= число поисков) попадает в день её created_at: это грубо, но лучше
+    пустых трендов. Дальше rollup ведёт компактор и rebuild_daily_agg().
+    """
+    day = func.date(SearchQuery.created_at)
+
+    src = (
+        select(
+            day,
+            SearchQuery.normalized_query,
+            SearchQuery.category_id,
+            func.max(SearchQuery.brand),
+            # строка search_queries = ключ, а не поиск: число поисков — popularity
+            func.coalesce(func.sum(SearchQuery.popularity), 0),
+            func.coalesce(func.sum(SearchQuery.popularity), 0),
+            func.coalesce(func.sum(SearchQuery.results_count * SearchQuery.popularity), 0),
+        )
+        .where(SearchQuery.created_at.is_not(None))
+        .group_by(day, SearchQuery.normalized_query, SearchQuery.category_id)
+    )
+
+    result = db.execute(
+        insert(SearchDailyAgg).from_select(
+            ["day", "normalized_query", "category_id", "brand", "searches", "popularity", "results"],
+            src,
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+def as_date(value: Union[date, datetime, str]) -> date:
+    # func.date() в SQLite возвращает строку, в Postgres — date
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value[:10], "%Y-%m-%d").date()
+
+
+def period_start(d: date, period: str) -> date:
+    """
+    day -> сам день, week -> понедельник, month -> 1-е число.
+    """
+    if period == "week":
+        return date.fromordinal(d.toordinal() - d.weekday())
+    if period == "month":
+        return d.replace(day=1)
+    return d
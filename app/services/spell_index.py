@@ -0,0 +1,206 @@
+# app/services/spell_index.py
+
+"""
+In-memory словарь опечаток (symmetric delete, как в SymSpell) для "возможно, вы искали".
+
+Словарь — токены из:
+- search_queries.normalized_query (вес = сумма popularity) — только запросов, которые
+  что-то нашли (results_count > 0) и повторялись хотя бы MIN_QUERY_POPULARITY раз:
+  иначе залогированная опечатка сама становится "словом" и перестаёт исправляться;
+- названий категорий (UA + RU) и keywords;
+- вариантов брендов (BRAND_SYNONYMS передаёт роутер, как AI_HINTS в suggest_index).
+
+Для каждого слова заранее кладём в dict все его удаления до MAX_EDIT_DISTANCE символов
+(по первым PREFIX_LENGTH символам — так память растёт линейно). Исправление токена =
+удаления самого токена -> dict-lookup каждого -> проверка кандидатов точным расстоянием
+Дамерау-Левенштейна. Никаких сканов словаря, только хэш-поиски.
+
+Пересборка — при старте и дальше раз в REBUILD_INTERVAL секунд в фоновом потоке
+(start_spell_refresh, как у suggest_index); get_spell_index() только читает
+готовый словарь, пока идёт пересборка — старый.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import Category, SearchQuery
+from app.services.index_refresh import start_periodic_rebuild
+from app.services.normalize import normalize_text
+
+MAX_EDIT_DISTANCE = 2
+PREFIX_LENGTH = 7
+MIN_WORD_LENGTH = 3          # "mi", "hp" исправлять бессмысленно
+REBUILD_INTERVAL = 600       # секунд
+MAX_QUERY_ROWS = 100_000     # самые популярные запросы; хвост словарь не улучшит
+DICTIONARY_WEIGHT = 1_000_000  # категории и бренды важнее любых пользовательских опечаток
+MIN_QUERY_POPULARITY = 3     # разовые запросы в словарь не берём
+# слово уже в словаре — исправляем, только если кандидат во столько раз частотнее
+CORRECTION_RATIO = 10
+
+
+def _deletes(word: str, max_distance: int) -> set:
+    """
+    Все строки, получаемые из word удалением до max_distance символов.
+    """
+    result = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        nxt = set()
+        for w in frontier:
+            if len(w) <= 1:
+                continue
+            for i in range(len(w)):
+                nxt.add(w[:i] + w[i + 1:])
+        nxt -= result
+        result |= nxt
+        frontier = nxt
+    return result
+
+
+def _distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Дамерау-Левенштейн (optimal string alignment) с ранним выходом:
+    > max_distance -> max_distance + 1.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            v = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                v = min(v, prev2[j - 2] + 1)
+            cur[j] = v
+            row_min = min(row_min, v)
+        if row_min > max_distance:
+            return max_distance + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def _max_distance_for(word: str) -> int:
+    # в коротком слове две правки — это уже другое слово
+    return 1 if len(word) <= 4 else MAX_EDIT_DISTANCE
+
+
+class SpellIndex:
+    def __init__(self, words: Dict[str, int]):
+        self.words = words
+        self.deletes: Dict[str, List[str]] = {}
+        for w in words:
+            for d in _deletes(w[:PREFIX_LENGTH], MAX_EDIT_DISTANCE):
+                bucket = self.deletes.get(d)
+                if bucket is None:
+                    self.deletes[d] = [w]
+                else:
+                    bucket.append(w)
+
+    def correct_word(self, word: str) -> Optional[str]:
+        """
+        Ближайшее известное слово (минимум правок, при равенстве — самое частое)
+        или None, если исправить нечем. Если word сам есть в словаре, кандидат
+        должен быть минимум в CORRECTION_RATIO раз частотнее — так редкая опечатка,
+        всё-таки попавшая в словарь, исправляется, а обычные слова — нет.
+        """
+        if len(word) < MIN_WORD_LENGTH or any(ch.isdigit() for ch in word):
+            return None
+
+        own = self.words.get(word, 0)
+        max_distance = _max_distance_for(word)
+        best = None
+        best_key = None
+        seen = {word}
+        for d in _deletes(word[:PREFIX_LENGTH], max_distance):
+            for cand in self.deletes.get(d, ()):
+                if cand in seen:
+                    continue
+                seen.add(cand)
+                if own and self.words[cand] < own * CORRECTION_RATIO:
+                    continue
+                dist = _distance(word, cand, max_distance)
+                if dist > max_distance:
+                    continue
+                key = (dist, -self.words[cand])
+                if best_key is None or key < best_key:
+                    best, best_key = cand, key
+        return best
+
+    def correct(self, text: Optional[str]) -> Optional[str]:
+        """
+        "самсунк галакси" -> "самсунг галакси"; None, если исправлять нечего.
+        """
+        tokens = normalize_text(text).split()
+        changed = False
+        out = []
+        for t in tokens:
+            fixed = self.correct_word(t)
+            if fixed is not None:
+                changed = True
+                out.append(fixed)
+            else:
+                out.append(t)
+        return " ".join(out) if changed else None
+
+
+def _add_words(words: Dict[str, int], text: Optional[str], weight: int) -> None:
+    for t in normalize_text(text).split():
+        if len(t) >= MIN_WORD_LENGTH and not t.isdigit():
+            words[t] = words.get(t, 0) + weight
+
+
+def _load_words(db: Session, extra_terms: Dict[str, Iterable[str]]) -> Dict[str, int]:
+    words: Dict[str, int] = {}
+
+    rows = (
+        db.query(SearchQuery.normalized_query, func.coalesce(SearchQuery.popularity, 1))
+        .filter(SearchQuery.results_count > 0, SearchQuery.popularity >= MIN_QUERY_POPULARITY)
+        .order_by(SearchQuery.popularity.desc())
+        .limit(MAX_QUERY_ROWS)
+        .all()
+    )
+    for nq, popularity in rows:
+        _add_words(words, nq, popularity)
+
+    for name, name_ru, keywords in db.query(Category.name, Category.name_ru, Category.keywords).all():
+        for s in (name, name_ru, keywords):
+            _add_words(words, s, DICTIONARY_WEIGHT)
+
+    for canonical, variants in extra_terms.items():
+        _add_words(words, canonical, DICTIONARY_WEIGHT)
+        for v in variants:
+            _add_words(words, v, DICTIONARY_WEIGHT)
+
+    return words
+
+
+_index: Optional[SpellIndex] = None
+# до первой сборки: пустой словарь — ничего не исправляем
+_EMPTY = SpellIndex({})
+
+
+def rebuild_spell_index(db: Session, extra_terms: Dict[str, Iterable[str]]) -> SpellIndex:
+    global _index
+    _index = SpellIndex(_load_words(db, extra_terms))
+    return _index
+
+
+def start_spell_refresh(extra_terms: Dict[str, Iterable[str]]) -> None:
+    """
+    Собрать словарь сейчас и пересобирать в фоне раз в REBUILD_INTERVAL секунд.
+    Вызывается на старте приложения (startup роутера /search).
+    """
+    start_periodic_rebuild("spell-index", lambda db: rebuild_spell_index(db, extra_terms), REBUILD_INTERVAL)
+
+
+def get_spell_index() -> SpellIndex:
+    """
+    Текущий словарь — без БД и без сборки в запросе.
+    """
+    return _index or _EMPTY
@@ -0,0 +1,147 @@
+# app/services/stage_timing.py
+
+"""
+Поэтапные таймеры для /search и /search/autocomplete.
+
+    timer = start_timer()
+    with timer.stage("count"):
+        ...
+    timer.finish(response, "search")
+
+- finish() пишет заголовок Server-Timing ("count;dur=3.21, fetch;dur=1.05")
+  и добавляет длительности в гистограммы по (endpoint, stage) —
+  их отдаёт GET /metrics/search-timing.
+- Включается SEARCH_TIMING=1. Выключено — start_timer() возвращает общий
+  пустой таймер: stage() отдаёт один и тот же no-op контекст, ни perf_counter,
+  ни блокировок, ни заголовка.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+SEARCH_TIMING = os.getenv("SEARCH_TIMING", "0") == "1"
+
+# верхние границы корзин, мс (последняя корзина — всё, что больше)
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+    _stage = _NullStage()
+
+    def stage(self, name: str) -> _NullStage:
+        return self._stage
+
+    def finish(self, response, endpoint: str) -> None:
+        pass
+
+
+class _Stage:
+    __slots__ = ("timer", "name", "t0")
+
+    def __init__(self, timer: "StageTimer", name: str):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.stages.append((self.name, (time.perf_counter() - self.t0) * 1000.0))
+        return False
+
+
+class StageTimer:
+    __slots__ = ("stages", "t0")
+
+    def __init__(self):
+        self.stages: List[Tuple[str, float]] = []
+        self.t0 = time.perf_counter()
+
+    def stage(self, name: str) -> _Stage:
+        return _Stage(self, name)
+
+    def finish(self, response, endpoint: str) -> None:
+        total = (time.perf_counter() - self.t0) * 1000.0
+        stages = self.stages + [("total", total)]
+        if response is not None:
+            response.headers["Server-Timing"] = ", ".join(f"{name};dur={ms:.2f}" for name, ms in stages)
+        stage_histograms.observe_many(endpoint, stages)
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def start_timer():
+    return StageTimer() if SEARCH_TIMING else _NULL_TIMER
+
+
+class StageHistograms:
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        # (endpoint, stage) -> [count, sum_ms, max_ms, counts по корзинам]
+        self._data: Dict[Tuple[str, str], list] = {}
+        self._lock = threading.Lock()
+
+    def observe_many(self, endpoint: str, stages: List[Tuple[str, float]]) -> None:
+        with self._lock:
+            for name, ms in stages:
+                h = self._data.get((endpoint, name))
+                if h is None:
+                    h = self._data[(endpoint, name)] = [0, 0.0, 0.0, [0] * (len(self.buckets) + 1)]
+                h[0] += 1
+                h[1] += ms
+                if ms > h[2]:
+                    h[2] = ms
+                h[3][bisect_left(self.buckets, ms)] += 1
+
+    def _quantile(self, counts: List[int], total: int, q: float) -> Optional[float]:
+        # верхняя граница корзины, в которую попал квантиль
+        rank = q * total
+        seen = 0
+        for i, c in enumerate(counts):
+            seen += c
+            if seen >= rank and c:
+                return self.buckets[i] if i < len(self.buckets) else None
+        return None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            items = [(k, h[0], h[1], h[2], list(h[3])) for k, h in self._data.items()]
+
+        out: Dict[str, dict] = {}
+        for (endpoint, name), count, total_ms, max_ms, counts in sorted(items):
+            out.setdefault(endpoint, {})[name] = {
+                "count": count,
+                "avg_ms": round(total_ms / count, 3) if count else 0.0,
+                "max_ms": round(max_ms, 3),
+                "p50_le_ms": self._quantile(counts, count, 0.5),
+                "p95_le_ms": self._quantile(counts, count, 0.95),
+                "p99_le_ms": self._quantile(counts, count, 0.99),
+                "buckets": {
+                    (f"le_{b}" if i < len(self.buckets) else "inf"): c
+                    for i, (b, c) in enumerate(zip((*self.buckets, None), counts))
+                },
+            }
+        return {"enabled": SEARCH_TIMING, "endpoints": out}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+stage_histograms = StageHistograms()
@@ -0,0 +1,293 @@
+# app/services/suggest_index.py
+
+"""
+In-memory префиксный индекс для /search/autocomplete и /search/suggestions.
+
+Trie по normalized_query: в каждом узле (= префиксе) заранее лежит top-K
+записей, отсортированных как в SQL:
+popularity_score desc (затухающая популярность), popularity desc, results_count desc, created_at desc.
+В подсказки идут только запросы, которые что-то нашли (results_count > 0):
+опечатку с пустой выдачей предлагать незачем.
+Кроме прошлых запросов в trie лежат названия категорий и AI_HINTS —
+они всегда ниже любых реальных запросов.
+
+Нажатие клавиши = спуск по trie на len(prefix) шагов, без БД.
+- note_search_query() — инкрементально обновляет индекс после логирования;
+- полная пересборка — при старте и дальше раз в REBUILD_INTERVAL секунд
+  в фоновом потоке (start_suggest_refresh); get_suggest_index() только
+  читает готовый индекс, пока идёт пересборка — старый.
+"""
+
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models import Category, SearchQuery
+from app.services.index_refresh import start_periodic_rebuild
+from app.services.normalize import normalize_query
+from app.services.popularity import QUERY_PREFIX_LEN, query_prefix
+
+TOP_K = 20
+REBUILD_INTERVAL = 600  # секунд
+MAX_QUERY_ENTRIES = 200_000  # самые популярные запросы; хвост в подсказки всё равно не попадёт
+
+KIND_QUERY = "query"
+KIND_CATEGORY = "category"
+KIND_HINT = "hint"
+
+
+class SuggestEntry:
+    __slots__ = (
+        "id", "kind", "value", "normalized", "category_id", "slug",
+        "score", "popularity", "results_count", "ts",
+    )
+
+    def __init__(self, id, kind, value, normalized, category_id=None, slug=None,
+                 popularity=0, results_count=0, ts=0.0, score=0.0):
+        self.id = id
+        self.kind = kind
+        self.value = value
+        self.normalized = normalized
+        self.category_id = category_id
+        self.slug = slug
+        self.score = score or 0.0
+        self.popularity = popularity or 0
+        self.results_count = results_count or 0
+        self.ts = ts or 0.0
+
+    def rank(self):
+        return (
+            self.kind == KIND_QUERY,
+            self.score,
+            self.popularity,
+            self.results_count,
+            self.ts,
+        )
+
+
+class _Node:
+    __slots__ = ("children", "top")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.top: List[SuggestEntry] = []
+
+
+class SuggestIndex:
+    def __init__(self, entries: Iterable[SuggestEntry], truncated: bool = False):
+        self.root = _Node()
+        # True -> в индекс попали не все запросы (MAX_QUERY_ENTRIES), хвост добираем из БД
+        self.truncated = truncated
+        self.by_query_id: Dict[int, SuggestEntry] = {}
+        self._write_lock = threading.Lock()
+
+        # вставляем в порядке ранга: первые TOP_K в каждом узле и есть топ
+        for e in sorted(entries, key=SuggestEntry.rank, reverse=True):
+            if e.kind == KIND_QUERY:
+                self.by_query_id[e.id] = e
+            node = self.root
+            for ch in e.normalized:
+                nxt = node.children.get(ch)
+                if nxt is None:
+                    nxt = node.children[ch] = _Node()
+                node = nxt
+                if len(node.top) < TOP_K:
+                    node.top.append(e)
+
+    def top(self, prefix: str, limit: int, kinds: Optional[set] = None) -> List[SuggestEntry]:
+        node = self.root
+        for ch in prefix:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        items = node.top
+        if kinds is not None:
+            items = [e for e in items if e.kind in kinds]
+        return items[:limit]
+
+    def bump(self, e: SuggestEntry) -> None:
+        """
+        Запись добавилась или выросла в ранге — обновляем top-K по её пути.
+        Списки не мутируем, а подменяем: читатели без блокировок видят либо старый, либо новый.
+        """
+        with self._write_lock:
+            node = self.root
+            rank = e.rank()
+            for ch in e.normalized:
+                nxt = node.children.get(ch)
+                if nxt is None:
+                    nxt = node.children[ch] = _Node()
+                node = nxt
+
+                top = node.top
+                if e in top:
+                    pass
+                elif len(top) < TOP_K:
+                    top = top + [e]
+                elif rank > top[-1].rank():
+                    top = top[:-1] + [e]
+                else:
+                    continue
+                node.top = sorted(top, key=SuggestEntry.rank, reverse=True)
+
+
+def _query_entry(r) -> SuggestEntry:
+    return SuggestEntry(
+        id=r.id,
+        kind=KIND_QUERY,
+        value=r.query,
+        normalized=r.normalized_query,
+        category_id=r.category_id,
+        slug=r.slug,
+        popularity=r.popularity,
+        score=r.popularity_score,
+        results_count=r.results_count,
+        ts=r.created_at.timestamp() if r.created_at else 0.0,
+    )
+
+
+def _query_rows(db: Session):
+    return (
+        db.query(
+            SearchQuery.id,
+            SearchQuery.query,
+            SearchQuery.normalized_query,
+            SearchQuery.category_id,
+            Category.slug,
+            SearchQuery.popularity,
+            SearchQuery.popularity_score,
+            SearchQuery.results_count,
+            SearchQuery.created_at,
+        )
+        .outerjoin(Category, Category.id == SearchQuery.category_id)
+        .filter(SearchQuery.results_count > 0)
+    )
+
+
+def db_prefix_entries(db: Session, prefix: str, limit: int, exclude_ids: set) -> List[SuggestEntry]:
+    """
+    Добор из БД, когда индекс урезан и для префикса в trie мало записей.
+
+    Префикс от QUERY_PREFIX_LEN символов: query_prefix = :p по индексу
+    (query_prefix, popularity_score DESC) — строки уже идут в нужном порядке,
+    LIMIT останавливает скан (более длинный префикс дофильтровывается LIKE).
+    Короче — LIKE 'prefix%' (text_pattern_ops в Postgres) + сортировка;
+    такие префиксы почти всегда закрывает trie.
+    """
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    like = SearchQuery.normalized_query.like(f"{escaped}%", escape="\\")
+
+    q = _query_rows(db)
+    if len(prefix) >= QUERY_PREFIX_LEN:
+        q = q.filter(SearchQuery.query_prefix == query_prefix(prefix))
+        if len(prefix) > QUERY_PREFIX_LEN:
+            q = q.filter(like)
+    else:
+        q = q.filter(like)
+
+    rows = (
+        q.order_by(SearchQuery.popularity_score.desc())
+        .limit(limit + len(exclude_ids))
+        .all()
+    )
+    return [_query_entry(r) for r in rows if r.id not in exclude_ids][:limit]
+
+
+def top_queries(db: Session, index: SuggestIndex, prefix: str, limit: int) -> List[SuggestEntry]:
+    """
+    Прошлые запросы по префиксу: из trie, а если индекс урезан и их не хватает — добор из БД.
+    """
+    items = index.top(prefix, limit, kinds={KIND_QUERY})
+    if len(items) < limit and index.truncated:
+        items = items + db_prefix_entries(db, prefix, limit - len(items), {e.id for e in items})
+    return items
+
+
+def _load_entries(db: Session, extra_hints: Dict[str, List[str]]) -> tuple:
+    entries: List[SuggestEntry] = []
+
+    rows = (
+        _query_rows(db)
+        .order_by(SearchQuery.popularity_score.desc().nullslast(), SearchQuery.popularity.desc())
+        .limit(MAX_QUERY_ENTRIES)
+        .all()
+    )
+    truncated = len(rows) >= MAX_QUERY_ENTRIES
+    entries.extend(_query_entry(r) for r in rows if r.normalized_query)
+
+    for c in db.query(Category.id, Category.slug, Category.name, Category.name_ru).all():
+        for name in {c.name, c.name_ru}:
+            if name:
+                entries.append(SuggestEntry(
+                    id=None,
+                    kind=KIND_CATEGORY,
+                    value=name,
+                    normalized=normalize_query(name),
+                    category_id=c.id,
+                    slug=c.slug,
+                ))
+
+    for hints in extra_hints.values():
+        for h in hints:
+            entries.append(SuggestEntry(id=None, kind=KIND_HINT, value=h, normalized=normalize_query(h)))
+
+    return entries, truncated
+
+
+_index: Optional[SuggestIndex] = None
+# до первой сборки: пустой trie, все подсказки — добором из БД (top_queries)
+_EMPTY = SuggestIndex([], truncated=True)
+
+
+def rebuild_suggest_index(db: Session, hints: Dict[str, List[str]]) -> SuggestIndex:
+    global _index
+    _index = SuggestIndex(*_load_entries(db, hints))
+    return _index
+
+
+def start_suggest_refresh(hints: Dict[str, List[str]]) -> None:
+    """
+    Собрать индекс сейчас и пересобирать в фоне раз в REBUILD_INTERVAL секунд.
+    Вызывается на старте приложения (startup роутера /search).
+    """
+    start_periodic_rebuild("suggest-index", lambda db: rebuild_suggest_index(db, hints), REBUILD_INTERVAL)
+
+
+def get_suggest_index() -> SuggestIndex:
+    """
+    Текущий индекс — без БД и без сборки в запросе.
+    """
+    return _index or _EMPTY
+
+
+def note_search_query(sq: SearchQuery, slug: Optional[str] = None) -> None:
+    """
+    Инкрементальное обновление после логирования запроса (popularity/results_count выросли
+    или появился новый запрос). Если индекс ещё не собран — ничего не делаем.
+    """
+    index = _index
+    if index is None or sq.id is None or not sq.normalized_query:
+        return
+
+    e = index.by_query_id.get(sq.id)
+    if e is None:
+        if not sq.results_count:
+            return
+        e = SuggestEntry(
+            id=sq.id,
+            kind=KIND_QUERY,
+            value=sq.query,
+            normalized=sq.normalized_query,
+            category_id=sq.category_id,
+            slug=slug,
+        )
+        index.by_query_id[sq.id] = e
+
+    e.value = sq.query
+    e.popularity = sq.popularity or 0
+    e.score = getattr(sq, "popularity_score", None) or 0.0
+    e.results_count = sq.results_count or 0
+    if sq.created_at:
+        e.ts = sq.created_at.timestamp()
+    index.bump(e)
@@ -0,0 +1,92 @@
+# scripts/backfill_search_enrichment.py
+#
+# Заполняет search_queries.brand / brand_score / model для старых строк
+# (новые обогащаются при логировании). Идём по id пачками, каждая пачка —
+# один executemany UPDATE и commit, так что скрипт можно прервать и перезапустить.
+# Теги считает enrich_search_queries_many: дубликаты внутри пачки матчатся один раз.
+# Если за прогон надо обработать от BRAND_POOL_MIN строк, на первой пачке поднимается
+# один ProcessPoolExecutor и живёт до конца прогона — старт процессов оплачивается один раз.
+#
+# Запуск из корня репозитория:
+#   python -m scripts.backfill_search_enrichment           # только необогащённые (brand_score IS NULL)
+#   python -m scripts.backfill_search_enrichment --all     # пересчитать всё (после правки BRAND_SYNONYMS)
+#   python -m scripts.backfill_search_enrichment --batch 10000
+#   python -m scripts.backfill_search_enrichment --all --batch 200000 --workers 8
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from sqlalchemy import func, update
+
+from app.db import SessionLocal
+from app.models import SearchQuery
+from app.routers.search import BRAND_POOL_MIN, enrich_search_queries_many
+
+
+def backfill(batch: int = 5000, recompute_all: bool = False, workers: Optional[int] = None) -> int:
+    db = SessionLocal()
+    done = 0
+    last_id = 0
+    t0 = time.perf_counter()
+    pool: Optional[ProcessPoolExecutor] = None
+    try:
+        base = db.query(SearchQuery.id, SearchQuery.normalized_query)
+        if not recompute_all:
+            base = base.filter(SearchQuery.brand_score.is_(None))
+        total = base.with_entities(func.count(SearchQuery.id)).scalar() or 0
+        print(f"to process: {total} rows")
+        use_pool = workers != 1 and total >= BRAND_POOL_MIN
+
+        while True:
+            rows = (
+                base.filter(SearchQuery.id > last_id)
+                .order_by(SearchQuery.id)
+                .limit(batch)
+                .all()
+            )
+            if not rows:
+                break
+
+            if use_pool and pool is None:
+                pool = ProcessPoolExecutor(max_workers=workers)
+            tags = enrich_search_queries_many([r.normalized_query or "" for r in rows], pool)
+            db.execute(
+                update(SearchQuery),
+                [{"id": r.id, **t} for r, t in zip(rows, tags)],
+            )
+            db.commit()
+
+            last_id = rows[-1].id
+            done += len(rows)
+            elapsed = time.perf_counter() - t0
+            rate = done / elapsed if elapsed else 0.0
+            eta = (total - done) / rate if rate and total > done else 0.0
+            pct = 100.0 * done / total if total else 100.0
+            print(
+                f"  {done}/{total} rows ({pct:.1f}%, last id {last_id}), "
+                f"{rate:.0f} rows/s, {elapsed:.1f}s elapsed, ETA {eta:.0f}s"
+            )
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        db.close()
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill brand/brand_score/model in search_queries")
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--all", action="store_true", help="пересчитать и уже обогащённые строки")
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="процессов для прогона от BRAND_POOL_MIN строк (по умолчанию — по числу CPU; 1 — без пула)",
+    )
+    args = parser.parse_args()
+
+    n = backfill(batch=args.batch, recompute_all=args.all, workers=args.workers)
+    print(f"done: {n} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# scripts/bench_extract_brand.py
+#
+# Бенчмарк extract_brand: старый вложенный цикл vs скомпилированный Aho-Corasick.
+# Запуск из корня репозитория:
+#   python -m scripts.bench_extract_brand            # 1 000 000 запросов
+#   python -m scripts.bench_extract_brand 200000
+import random
+import sys
+import time
+from typing import Optional, Tuple
+
+from app.routers.search import BRAND_SYNONYMS, _tokens, extract_brand, normalize_query
+
+# Словарь "обычных" слов, чтобы запросы были похожи на реальные
+FILLER = [
+    "бу", "новый", "купить", "цена", "чехол", "зарядка", "pro", "max", "mini",
+    "128", "256", "11", "13", "15", "ultra", "ноутбук", "телефон", "кроссовки",
+    "квартира", "аренда", "авто", "iphone11", "ps5pro", "redmi9", "белый", "черный",
+]
+
+
+def extract_brand_reference(query: str) -> Tuple[Optional[str], float]:
+    """
+    Исходная реализация extract_brand (до автомата) — эталон для сверки.
+    """
+    qn = normalize_query(query)
+    toks = _tokens(qn)
+    if not toks:
+        return None, 0.0
+
+    qn_spaced = f" {qn} "
+
+    best_brand = None
+    best_score = 0.0
+
+    for brand, variants in BRAND_SYNONYMS.items():
+        local_best = 0.0
+        for v in variants:
+            v_norm = normalize_query(v)
+
+            if " " in v_norm:
+                if f" {v_norm} " in qn_spaced:
+                    local_best = max(local_best, 1.0)
+                continue
+
+            if v_norm in toks:
+                local_best = max(local_best, 0.95)
+                continue
+
+            if v_norm and v_norm in qn:
+                local_best = max(local_best, 0.75)
+
+        if local_best > best_score:
+            best_score = local_best
+            best_brand = brand
+
+    return best_brand, best_score
+
+
+def make_queries(n: int, seed: int = 42) -> list:
+    rnd = random.Random(seed)
+    variants = [v for vs in BRAND_SYNONYMS.values() for v in vs]
+    out = []
+    for _ in range(n):
+        words = rnd.sample(FILLER, rnd.randint(1, 4))
+        if rnd.random() < 0.7:
+            words.insert(rnd.randint(0, len(words)), rnd.choice(variants))
+        q = " ".join(words)
+        if rnd.random() < 0.2:
+            q = q.upper()
+        out.append(q)
+    return out
+
+
+def bench(fn, queries) -> float:
+    t0 = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return time.perf_counter() - t0
+
+
+def main(n: int = 1_000_000):
+    queries = make_queries(n)
+
+    # сверка на подвыборке: результаты должны совпадать 1:1
+    sample = queries[:20000]
+    mismatches = [q for q in sample if extract_brand(q) != extract_brand_reference(q)]
+    print(f"check: {len(sample)} queries, mismatches: {len(mismatches)}")
+    for q in mismatches[:10]:
+        print("  ", q, extract_brand(q), extract_brand_reference(q))
+
+    t_new = bench(extract_brand, queries)
+    t_old = bench(extract_brand_reference, queries)
+
+    print(f"queries:   {n}")
+    print(f"reference: {t_old:.2f}s  ({t_old / n * 1e6:.2f} us/query)")
+    print(f"compiled:  {t_new:.2f}s  ({t_new / n * 1e6:.2f} us/query)")
+    print(f"speedup:   x{t_old / t_new:.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
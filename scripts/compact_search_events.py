@@ -0,0 +1,51 @@
+# scripts/compact_search_events.py
+#
+# Сворачивает очередь search_events в search_queries и search_daily_agg.
+# Обычно это делает фоновый поток приложения раз в SEARCH_COMPACT_INTERVAL
+# секунд; скрипт — для крона при SEARCH_COMPACT_INTERVAL=0 или чтобы
+# разобрать накопившийся хвост. Параллельный запуск безопасен: в Postgres
+# пачки забираются через FOR UPDATE SKIP LOCKED.
+# После компакции удаляет свёрнутые события старше --retention-days
+# (по умолчанию SEARCH_EVENTS_RETENTION_DAYS, 0 — не удалять).
+#
+# Запуск из корня репозитория:
+#   python -m scripts.compact_search_events
+#   python -m scripts.compact_search_events --batch 50000
+#   python -m scripts.compact_search_events --retention-days 0
+import argparse
+import time
+
+from app.db import SessionLocal
+from app.services.search_log import (
+    SEARCH_COMPACT_BATCH,
+    SEARCH_EVENTS_RETENTION_DAYS,
+    compact_search_events,
+    purge_search_events,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fold search_events into search_queries / search_daily_agg")
+    parser.add_argument("--batch", type=int, default=SEARCH_COMPACT_BATCH)
+    parser.add_argument("--retention-days", type=int, default=SEARCH_EVENTS_RETENTION_DAYS)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    done = 0
+    t0 = time.perf_counter()
+    try:
+        while True:
+            result = compact_search_events(db, args.batch)
+            done += result.events
+            if result.events:
+                print(f"  {done} events -> {len(result.rows)} queries, {time.perf_counter() - t0:.1f}s")
+            if result.events < args.batch:
+                break
+        purged = purge_search_events(db, args.retention_days)
+    finally:
+        db.close()
+    print(f"done: {done} events, purged {purged} old events")
+
+
+if __name__ == "__main__":
+    main()
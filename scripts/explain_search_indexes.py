@@ -0,0 +1,123 @@
+# scripts/explain_search_indexes.py
+#
+# Проверяет планы запросов к search_queries: каждый должен идти по своему индексу.
+#   - query_prefix = ? ORDER BY popularity_score -> ix_search_queries_prefix_score
+#   - LIKE 'prefix%' (короткий префикс)          -> ix_search_queries_nq_pattern (Postgres)
+#                                                   / uq_search_queries_key (SQLite)
+#   - ключ upsert-а (normalized_query, категория) -> uq_search_queries_key
+#   - created_at >= ?                             -> ix_search_queries_created_at
+# Печатает планы; если хоть один запрос не использует ожидаемый индекс — код выхода 1
+# (годится для CI после миграций).
+#
+# SQLite берёт индекс под LIKE только с PRAGMA case_sensitive_like = ON — её
+# ставит app/db.py на каждом соединении, так что план тот же, что у приложения.
+#
+# Запуск: python -m scripts.explain_search_indexes [prefix]
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app.db import SessionLocal
+from app.services.popularity import QUERY_PREFIX_LEN, query_prefix
+
+# (название, SQL, ожидаемый индекс: {dialect: имя})
+CHECKS = [
+    (
+        "prefix key, ordered by decayed popularity",
+        "SELECT id FROM search_queries "
+        "WHERE query_prefix = :qp AND normalized_query LIKE :prefix "
+        "ORDER BY popularity_score DESC LIMIT 10",
+        {
+            "postgresql": "ix_search_queries_prefix_score",
+            "sqlite": "ix_search_queries_prefix_score",
+        },
+    ),
+    (
+        "short prefix LIKE",
+        "SELECT id FROM search_queries "
+        "WHERE normalized_query LIKE :short",
+        {
+            "postgresql": "ix_search_queries_nq_pattern",
+            "sqlite": "uq_search_queries_key",
+        },
+    ),
+    (
+        "upsert key (normalized_query, category)",
+        "SELECT id FROM search_queries "
+        "WHERE normalized_query = :nq AND COALESCE(category_id, 0) = :cat",
+        {
+            "postgresql": "uq_search_queries_key",
+            "sqlite": "uq_search_queries_key",
+        },
+    ),
+    (
+        "created_at window",
+        "SELECT id, normalized_query FROM search_queries "
+        "WHERE created_at >= :since",
+        {
+            "postgresql": "ix_search_queries_created_at",
+            "sqlite": "ix_search_queries_created_at",
+        },
+    ),
+]
+
+
+def uses_index(dialect: str, plan: str, index_name: str) -> bool:
+    if index_name not in plan:
+        return False
+    if dialect == "postgresql":
+        # Index Scan / Index Only Scan / Bitmap Index Scan
+        return "Index" in plan and "Scan" in plan
+    # SEARCH search_queries USING [COVERING] INDEX ix_...
+    return "USING INDEX" in plan or "USING COVERING INDEX" in plan
+
+
+def main(prefix: str = "айфон") -> int:
+    db = SessionLocal()
+    failed = []
+    try:
+        dialect = db.bind.dialect.name
+        explain = "EXPLAIN QUERY PLAN" if dialect == "sqlite" else "EXPLAIN"
+        if dialect == "postgresql":
+            # на маленькой таблице planner честно выберет seq scan — запрещаем его для наглядности
+            db.execute(text("SET enable_seqscan = off"))
+
+        params = {
+            "qp": query_prefix(prefix),
+            "prefix": f"{prefix}%",
+            "short": f"{prefix[:QUERY_PREFIX_LEN - 1]}%",
+            "nq": prefix,
+            "cat": 1,
+            "since": datetime.utcnow() - timedelta(days=30),
+        }
+        for title, sql, expected in CHECKS:
+            index_name = expected.get(dialect)
+            rows = db.execute(text(f"{explain} {sql}"), params).all()
+            plan = "\n".join(" | ".join(str(x) for x in row) for row in rows)
+
+            if index_name is None:
+                status = "SKIP"
+            elif uses_index(dialect, plan, index_name):
+                status = "OK"
+            else:
+                status = "FAIL"
+                failed.append(f"{title}: expected {index_name}")
+
+            print(f"--- [{status}] {title}" + (f" -> {index_name}" if index_name else ""))
+            for line in plan.splitlines():
+                print("   ", line)
+    finally:
+        db.close()
+
+    if failed:
+        print("\nindex checks failed:")
+        for f in failed:
+            print("  ", f)
+        return 1
+    print("\nall index checks passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else "айфон"))
@@ -0,0 +1,36 @@
+# scripts/rebuild_search_daily_agg.py
+#
+# Пересобирает дневной rollup search_daily_agg из search_events (одно событие =
+# один поиск) за дни начиная с --since; по умолчанию — со дня после самого раннего
+# сохранённого события. Дни раньше не трогаются: событий за них уже нет
+# (retention) или их нет вовсе — тогда rollup заполнен из search_queries при деплое.
+# Нужен после ручных правок или если инкрементальные апдейты компактора где-то терялись.
+# Запускать при остановленном компакторе (SEARCH_COMPACT_INTERVAL=0 у приложения).
+#
+# Запуск из корня репозитория:
+#   python -m scripts.rebuild_search_daily_agg
+#   python -m scripts.rebuild_search_daily_agg --since 2026-09-01
+import argparse
+import time
+from datetime import date
+
+from app.db import SessionLocal
+from app.services.search_rollup import rebuild_daily_agg
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild search_daily_agg from search_events")
+    parser.add_argument("--since", type=date.fromisoformat, default=None, help="YYYY-MM-DD")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    t0 = time.perf_counter()
+    try:
+        n = rebuild_daily_agg(db, args.since)
+    finally:
+        db.close()
+    print(f"search_daily_agg: {n} rows in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
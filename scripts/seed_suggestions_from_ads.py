@@ -1,5 +1,4 @@
 # scripts/seed_suggestions_from_ads.py
-import re
 from collections import Counter
 from datetime import datetime, timedelta
 
@@ -8,6 +7,8 @@ from sqlalchemy.orm import Session
 
 from app.db import SessionLocal  # или твой get_db / SessionLocal
 from app.models import OlxAd, SearchQuery
+from app.services.normalize import normalize_many, normalize_text
+from app.services.popularity import decay_weight, query_prefix
 
 # Минимальный стоп-лист. Можно расширять.
 STOP_WORDS = {
@@ -17,13 +18,6 @@ STOP_WORDS = {
     "грн", "uah", "usd", "дол", "евро", "€", "$",
 }
 
-def normalize_text(s: str) -> str:
-    s = (s or "").lower().strip()
-    # убрать всё кроме букв/цифр/пробелов
-    s = re.sub(r"[^0-9a-zа-яёіїєґ\s]+", " ", s, flags=re.IGNORECASE)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
-
 def tokenize(s: str) -> list[str]:
     tokens = [t for t in s.split() if t]
     cleaned = []
@@ -58,8 +52,10 @@ def upsert_query(db: Session, query: str, popularity_add: int, source: str = "ad
         .filter(SearchQuery.normalized_query == normalized)
         .first()
     )
+    score_add = popularity_add * decay_weight(datetime.utcnow())
     if sq:
         sq.popularity = (sq.popularity or 0) + popularity_add
+        sq.popularity_score = (sq.popularity_score or 0) + score_add
         sq.source = source
         # results_count можно не трогать или оставить как есть
     else:
@@ -68,6 +64,8 @@ def upsert_query(db: Session, query: str, popularity_add: int, source: str = "ad
             normalized_query=normalized,
             results_count=0,
             popularity=popularity_add,
+            popularity_score=score_add,
+            query_prefix=query_prefix(normalized),
             source=source,
         )
         db.add(sq)
@@ -90,8 +88,10 @@ def main(days: int = 180, limit_ads: int = 20000, top_phrases: int = 1500):
 
         counter = Counter()
 
-        for (title,) in titles:
-            norm = normalize_text(title)
+        # батч: одинаковые заголовки нормализуются один раз
+        normalized = normalize_many((t for (t,) in titles), normalize_text)
+
+        for norm in normalized:
             if not norm:
                 continue
             tokens = tokenize(norm)